@@ -1,12 +1,24 @@
 
 from __future__ import annotations
 from enum import Enum
-from dataclasses import dataclass
-from typing import Callable, Iterable, Iterator
+from functools import partial
+from array import array
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Any, Callable, Iterable, Iterator, Sequence
 from rich.console import Console
 from rich.panel import Panel
 
 from koseki_ops import *
+from koseki_intrinsics import WORDS_PER_STEP, safe_get_intrinsic
+from koseki_jit import LoopCache
+from koseki_optimize import optimize_OPs
+from koseki_profile import Profiler
+from koseki_trace import Tracer, compile_debug
+from koseki_verify import Verification, verify_OPs
+from koseki_ram import RAM, PagedRAM, SparseRAM, wrap_word
 
 def safe_get_function(code: int, library: Library) -> Function:
 	return library[code] if 0 <= code < len(library) else library[0]
@@ -17,6 +29,22 @@ class ProcessStatus(Enum):
 	HALTED = "halted"
 	WAITING = "waiting"
 	SLEEPING = "sleeping"
+	EXCEEDED = "exceeded"
+	THROTTLED = "throttled"
+
+STATUS_INVALID: int = 0
+STATUS_RUNNING: int = 1
+STATUS_HALTED: int = 2
+STATUS_WAITING: int = 3
+STATUS_SLEEPING: int = 4
+STATUS_EXCEEDED: int = 5
+STATUS_THROTTLED: int = 6
+
+PROCESS_STATUSES: tuple[ProcessStatus, ...] = (
+	ProcessStatus.INVALID, ProcessStatus.RUNNING, ProcessStatus.HALTED,
+	ProcessStatus.WAITING, ProcessStatus.SLEEPING,
+	ProcessStatus.EXCEEDED, ProcessStatus.THROTTLED
+)
 
 def parse_process_status(process_status: ProcessStatus) -> int:
 	match process_status:
@@ -25,31 +53,214 @@ def parse_process_status(process_status: ProcessStatus) -> int:
 		case ProcessStatus.HALTED: return 2
 		case ProcessStatus.WAITING: return 3
 		case ProcessStatus.SLEEPING: return 4
+		case ProcessStatus.EXCEEDED: return 5
+		case ProcessStatus.THROTTLED: return 6
+
+class SignalPolicy(Enum):
+	DROP_NEW = "drop new"
+	DROP_OLDEST = "drop oldest"
+	BLOCK = "block"
+
+class QuotaPolicy(Enum):
+	STOP = "stop"
+	THROTTLE = "throttle"
+
+@dataclass
+class Quota:
+	stack_depth: int|None = None
+	RAM_words: int|None = None
+	children: int|None = None
+	instructions: int|None = None
+
+@dataclass
+class Usage:
+	instructions: int = 0
+	RAM_words: int = 0
+	children: int = 0
+
+class Interpreter(Enum):
+	MATCH = "match"
+	THREADED = "threaded"
+	TIERED = "tiered"
+
+def match_conditionals(ops: tuple[OP, ...]) -> tuple[int, ...]:
+	jumps: list[int] = [ -1 ]*len(ops)
+	opened: list[int] = [ ]
+
+	for key, op in enumerate(ops):
+		match op:
+			case ConditionalOpen():
+				opened.append(key)
+
+			case ConditionalClose():
+				if opened:
+					open_key = opened.pop()
+					jumps[open_key] = key
+					jumps[key] = open_key
+
+				else:
+					jumps[key] = 0
+
+	for open_key in opened:
+		jumps[open_key] = len(ops)
+
+	return tuple(jumps)
+
+type Handler = Callable[[Process, Machine, int, Any], None]
+type Code = tuple[tuple[Handler, Any], ...]
+
+def decode_OPs(ops: tuple[OP, ...], jumps: tuple[int, ...], proven: tuple[bool, ...]|None = None) -> Code:
+	code: list[tuple[Handler, Any]] = [ ]
+	if proven is None: proven = verify_OPs(ops, jumps).proven
+
+	for key, op in enumerate(ops):
+		match op:
+			case PushData(arg=value): code.append((Process._run_push_data, wrap_word(value)))
+			case ConditionalOpen(): code.append((Process._run_conditional_open, jumps[key]))
+			case ConditionalClose(): code.append((Process._run_conditional_close, jumps[key]))
+			case SetA(): code.append((Process._run_set_a, None))
+			case SetB(): code.append((Process._run_set_b, None))
+			case SetC(): code.append((Process._run_set_c, None))
+			case PushA(): code.append((Process._run_push_a, None))
+			case PushB(): code.append((Process._run_push_b, None))
+			case PushC(): code.append((Process._run_push_c, None))
+			case ConstantA(arg=value): code.append((Process._run_constant_a, value))
+			case ConstantB(arg=value): code.append((Process._run_constant_b, value))
+			case ConstantC(arg=value): code.append((Process._run_constant_c, value))
+			case MoveA(): code.append((Process._run_move_a, None))
+			case MoveB(): code.append((Process._run_move_b, None))
+			case MoveC(): code.append((Process._run_move_c, None))
+
+			case Arithmetics(arg=function_code):
+				function = safe_get_function(function_code, ARITHMETICS)
+				code.append((Process._run_arithmetics, function.callback))
+
+			case DropData(): code.append((Process._run_drop_data, None))
+			case SaveAlt(): code.append((Process._run_save_alt, None))
+			case LoadAlt(): code.append((Process._run_load_alt, None))
+			case Halt(): code.append((Process._run_halt, None))
+			case SendSignal(): code.append((Process._run_send_signal, None))
+			case PullSignal(): code.append((Process._run_pull_signal, None))
+			case SpawnProcess(): code.append((Process._run_spawn_process, None))
+			case ReadProcess(): code.append((Process._run_read_process, None))
+			case ReadRAM(): code.append((Process._run_read_RAM, None))
+			case WriteRAM(): code.append((Process._run_write_RAM, None))
+			case CloneRAM(): code.append((Process._run_clone_RAM, None))
+			case DropRAM(): code.append((Process._run_drop_RAM, None))
+			case Call(): code.append((Process._run_call, None))
+			case Sleep(): code.append((Process._run_sleep, None))
+			case Intrinsic(arg=function_code): code.append((Process._run_intrinsic, safe_get_intrinsic(function_code).callback))
+			case Debug(python=python): code.append((Process._run_debug, compile_debug(python)))
+			case NoOP(): code.append((Process._run_no_op, None))
+
+			case SetAConstantBArithmetics(arg=value, function=function_code):
+				function = safe_get_function(function_code, ARITHMETICS)
+				code.append((Process._run_set_a_constant_b_arithmetics, (value, function.callback)))
+
+			case ConstantBArithmetics(arg=value, function=function_code):
+				function = safe_get_function(function_code, ARITHMETICS)
+				code.append((Process._run_constant_b_arithmetics, (value, function.callback)))
+
+			case DropDataPushA(): code.append((Process._run_drop_data_push_a, None))
+			case DropDataPushData(arg=value): code.append((Process._run_drop_data_push_data, wrap_word(value)))
+			case op: code.append((Process._run_not_implemented, op))
+
+	# ops whose stack accesses the verifier proved in bounds skip the emptiness checks
+	return tuple(
+		(UNCHECKED_HANDLERS.get(handler, handler), arg) if is_proven else (handler, arg)
+		for (handler, arg), is_proven in zip(code, proven)
+	)
 
 @dataclass
+class Program:
+	ops: tuple[OP, ...]
+	jumps: tuple[int, ...]
+	code: Code|None = None
+	loops: LoopCache = field(default_factory=LoopCache, repr=False)
+	verification: Verification|None = field(default=None, repr=False)
+
+	@staticmethod
+	def new(ops: tuple[OP, ...]) -> Program:
+		return Program(ops, match_conditionals(ops))
+
+	def verify(self) -> Verification:
+		if self.verification is None:
+			self.verification = verify_OPs(self.ops, self.jumps)
+			self.loops.proven = self.verification.proven
+
+		return self.verification
+
+	def decode(self) -> Code:
+		if self.code is None: self.code = decode_OPs(self.ops, self.jumps, self.verify().proven)
+		return self.code
+
+@dataclass(slots=True)
+class Frame:
+	ops: tuple[OP, ...]
+	jumps: tuple[int, ...]
+	code: Code|None
+	loops: LoopCache|None
+	alt_data: array|None
+	head: int
+	a: int
+	b: int
+	c: int
+
+	def fork(self) -> Frame:
+		return Frame(
+			self.ops, self.jumps, self.code, self.loops,
+			self.alt_data[:] if self.alt_data is not None else None, self.head, self.a, self.b, self.c
+		)
+
+@dataclass(slots=True)
 class Process:
-	_data: list[int]
-	_alt_data: list[int]
+	_data: array
+	_alt_data: array|None
 	_ops: tuple[OP, ...]
-	_signals: list[int]
+	_jumps: tuple[int, ...] = field(repr=False)
+	_signals: array|None
 	_head: int
 	_a: int
 	_b: int
 	_c: int
-	_status: ProcessStatus
+	_status: int
 	_parent_process: int|None
+	_code: Code|None = field(default=None, repr=False)
+	_sleep_ticks: int = field(default=0, repr=False)
+	_signal_capacity: int|None = field(default=None, repr=False)
+	_signal_head: int = field(default=0, repr=False)
+	_loops: LoopCache|None = field(default=None, repr=False)
+	_cost: int = field(default=0, repr=False)
+	_frames: list[Frame]|None = field(default=None, repr=False)
+	_frame_words: int = field(default=0, repr=False)
 
 	@property
 	def status(self) -> ProcessStatus:
-		return self._status
+		return PROCESS_STATUSES[self._status]
 	
 	@status.setter
 	def status(self, value: ProcessStatus):
-		self._status = value
+		self._status = parse_process_status(value)
+
+	@property
+	def signal_capacity(self) -> int|None:
+		return self._signal_capacity
+
+	@signal_capacity.setter
+	def signal_capacity(self, value: int|None):
+		self._signal_capacity = value
 	
+	@property
+	def stack_size(self) -> int:
+		return len(self._data) + (len(self._alt_data) if self._alt_data is not None else 0) + self._frame_words
+
+	@property
+	def call_depth(self) -> int:
+		return len(self._frames) if self._frames is not None else 0
+
 	@property
 	def data_size(self) -> int:
-		return len(self._data) + len(self._alt_data) + len(self._signals)
+		return self.stack_size + self.signal_count
 	
 	@property
 	def parent_process(self) -> int|None:
@@ -57,29 +268,106 @@ class Process:
 	
 	@property
 	def has_signal_queued(self) -> bool:
-		return len(self._signals) > 0
+		return self._signals is not None and len(self._signals) > self._signal_head
+
+	def shares_data_with(self, other: Process) -> bool:
+		return self._data is other._data
+
+	@property
+	def signal_count(self) -> int:
+		return len(self._signals) - self._signal_head if self._signals is not None else 0
 
 	@staticmethod
 	def new(ops: tuple[OP, ...]) -> Process:
+		return Process.load(Program.new(ops))
+
+	@staticmethod
+	def load(program: Program) -> Process:
+		return Process(
+			array("q"), None, program.ops, program.jumps, None, 0,
+			0, 0, 0, STATUS_RUNNING, None, program.code, _loops=program.loops
+		)
+
+	def fork(self, stacks: dict[int, array]) -> Process:
+		data = stacks.get(id(self._data))
+		if data is None: data = stacks[id(self._data)] = self._data[:]
+
 		return Process(
-			[ ], [ ], ops, [ ], 0,
-			0, 0, 0, ProcessStatus.RUNNING, None
+			data, self._alt_data[:] if self._alt_data is not None else None,
+			self._ops, self._jumps,
+			self._signals[self._signal_head:] if self._signals is not None else None, self._head,
+			self._a, self._b, self._c, self._status, self._parent_process, self._code,
+			self._sleep_ticks, self._signal_capacity, _loops=self._loops, _cost=self._cost,
+			_frames=[ frame.fork() for frame in self._frames ] if self._frames else None, _frame_words=self._frame_words
 		)
 
+	def _call(self, machine: Machine, program: Program):
+		if self._frames is None: self._frames = [ ]
+		self._frames.append(Frame(
+			self._ops, self._jumps, self._code, self._loops, self._alt_data, self._head + 1, self._a, self._b, self._c
+		))
+		self._frame_words += len(self._alt_data) if self._alt_data is not None else 0
+		machine._frame_count += 1
+		self._ops, self._jumps, self._code, self._loops = program.ops, program.jumps, program.code, program.loops
+		self._alt_data = None
+		self._head = -1
+		self._a = self._b = self._c = 0
+
+	def _return(self, machine: Machine):
+		frame = self._frames.pop()
+		self._frame_words -= len(frame.alt_data) if frame.alt_data is not None else 0
+		machine._frame_count -= 1
+		self._ops, self._jumps, self._code, self._loops = frame.ops, frame.jumps, frame.code, frame.loops
+		self._alt_data = frame.alt_data
+		self._head = frame.head
+		self._a, self._b, self._c = frame.a, frame.b, frame.c
+		self._status = STATUS_HALTED if self._head >= len(self._ops) else STATUS_RUNNING
+
 	def make_child(self, ops: tuple[OP, ...], parent_process: int) -> Process:
+		return self.load_child(Program.new(ops), parent_process)
+
+	def load_child(self, program: Program, parent_process: int) -> Process:
 		return Process(
-			self._data, [ ], ops, [ ], 0,
-			0, 0, 0, ProcessStatus.RUNNING, parent_process
+			self._data, None, program.ops, program.jumps, None, 0,
+			0, 0, 0, STATUS_RUNNING, parent_process, program.code, _loops=program.loops
 		)
 	
 	def on_receive_signal(self, signal: int):
-		self._signals.append(signal)
+		if self._signals is None: self._signals = array("q")
+		try: self._signals.append(signal)
+		except OverflowError: self._signals.append(wrap_word(signal))
+
+	def on_receive_signals(self, signals: Iterable[int]):
+		for signal in signals: self.on_receive_signal(signal)
 
 	def pull_signal(self) -> int:
-		return self._signals.pop(0)
+		if not self.has_signal_queued: raise IndexError("pull from an empty signal queue")
+		signal = self._signals[self._signal_head]
+		self._signal_head += 1
+
+		if self._signal_head == len(self._signals):
+			del self._signals[:]
+			self._signal_head = 0
+
+		elif self._signal_head > 64 and 2*self._signal_head > len(self._signals):
+			del self._signals[:self._signal_head]
+			self._signal_head = 0
+
+		return signal
 
 	def _safe_pull_signal(self) -> int:
-		return self._signals.pop(0) if self._signals else 0
+		return self.pull_signal() if self.has_signal_queued else 0
+
+	def drain_signals(self) -> list[int]:
+		if self._signals is None: return [ ]
+		signals = self._signals[self._signal_head:].tolist()
+		del self._signals[:]
+		self._signal_head = 0
+		return signals
+
+	def _push_data(self, value: int):
+		try: self._data.append(value)
+		except OverflowError: self._data.append(wrap_word(value))
 
 	def _safe_get_op(self, key: int) -> OP:
 		return self._ops[key] if 0 <= key < len(self._ops) else NoOP()
@@ -92,7 +380,7 @@ class Process:
 
 	def run_step(self, machine: Machine, process_key: int):
 		if self._head >= len(self._ops):
-			self._status = ProcessStatus.HALTED
+			self._status = STATUS_HALTED
 			return
 
 		if self._head < 0:
@@ -100,37 +388,15 @@ class Process:
 
 		match self._ops[self._head]:
 			case PushData(arg=value):
-				self._data.append(value)
+				self._push_data(value)
 
 			case ConditionalOpen():
 				if self._a == 0:
-					level: int = 1
-
-					while level > 0:
-						self._head += 1
-
-						if self._head >= len(self._ops):
-							self._head = len(self._ops)
-							break
-
-						match self._ops[self._head]:
-							case ConditionalOpen(): level += 1
-							case ConditionalClose(): level -= 1
+					self._head = self._jumps[self._head]
 
 			case ConditionalClose():
 				if self._a != 0:
-					level: int = 1
-
-					while level > 0:
-						self._head -= 1
-
-						if self._head < 0:
-							self._head = 0
-							break
-			
-						match self._ops[self._head]:
-							case ConditionalOpen(): level -= 1
-							case ConditionalClose(): level += 1
+					self._head = self._jumps[self._head]
 
 			case SetA():
 				self._a = self._safe_get_data()
@@ -142,13 +408,13 @@ class Process:
 				self._c = self._safe_get_data()
 
 			case PushA():
-				self._data.append(self._a)
+				self._push_data(self._a)
 
 			case PushB():
-				self._data.append(self._b)
+				self._push_data(self._b)
 
 			case PushC():
-				self._data.append(self._c)
+				self._push_data(self._c)
 
 			case ConstantA(arg=value):
 				self._a = value
@@ -176,23 +442,27 @@ class Process:
 				self._data.pop() if self._data else ...
 
 			case SaveAlt():
-				self._alt_data.append(self._data.pop()) if self._data else ...
+				if self._data:
+					if self._alt_data is None: self._alt_data = array("q")
+					self._alt_data.append(self._data.pop())
 
 			case LoadAlt():
 				self._data.append(self._alt_data.pop()) if self._alt_data else ...
 
 			case Halt():
-				self._status = ProcessStatus.HALTED
+				self._status = STATUS_HALTED
 
 			case SendSignal():
-				machine.safe_send_signal(self._b, self._a)
+				if not machine.safe_send_signal(self._b, self._a, process_key) and machine.blocks_signal_senders:
+					self._status = STATUS_WAITING
+					self._head -= 1
 
 			case PullSignal():
-				self._a = self._safe_pull_signal()
+				# a callee running in a call frame has no process key of its own, so nothing can signal it
+				self._a = machine.safe_pull_signal(process_key) if not self._frames else 0
 
 			case SpawnProcess():
-				ram = machine.safe_get_RAM(self._a)
-				process = Process.new(safe_parse_RAM(ram))
+				process = Process.load(machine.safe_get_program(self._a))
 				machine.spawn_process(process, self._b)
 
 			case ReadProcess():
@@ -211,178 +481,1065 @@ class Process:
 				machine.safe_drop_RAM(self._a)
 
 			case Call():
-				self._status = ProcessStatus.WAITING
-				ops = safe_parse_RAM(machine.safe_get_RAM(self._a))
-				child = self.make_child(ops, process_key)
-				machine.spawn_process(child)
+				if machine._call_frames:
+					self._call(machine, machine.safe_get_program(self._a))
+
+				else:
+					self._status = STATUS_WAITING
+					child = self.load_child(machine.safe_get_program(self._a), process_key)
+					machine.spawn_process(child)
 
 			case Sleep():
-				self.status = ProcessStatus.SLEEPING
+				self._status = STATUS_SLEEPING
+				self._sleep_ticks = self._a
+
+			case Intrinsic(arg=code):
+				self._cost += safe_get_intrinsic(code).callback(self, machine) // WORDS_PER_STEP
 
 			case Debug(python=python):
-				print(f"{self._a} {self._b} {self._c} {self._data}")
-				exec(python)
+				self._run_debug(machine, process_key, compile_debug(python))
+
+			case NoOP(): ...
+
+			case SetAConstantBArithmetics(arg=value, function=code):
+				self._a = self._safe_get_data()
+				self._b = value
+				function = safe_get_function(code, ARITHMETICS)
+				self._a = function.callback(self._a, self._b, self._c)
+
+			case ConstantBArithmetics(arg=value, function=code):
+				self._b = value
+				function = safe_get_function(code, ARITHMETICS)
+				self._a = function.callback(self._a, self._b, self._c)
+
+			case DropDataPushA():
+				if self._data: self._data.pop()
+				self._push_data(self._a)
+
+			case DropDataPushData(arg=value):
+				if self._data: self._data.pop()
+				self._push_data(value)
 
 			case op: raise Exception(f"not implemented: {op}")
 
 		self._head += 1
 
 		if self._head >= len(self._ops):
-			self._status = ProcessStatus.HALTED
+			self._status = STATUS_HALTED
+			return
+
+	def run_threaded_step(self, machine: Machine, process_key: int):
+		if self._code is None:
+			# processes loaded from one program share its loop cache, so they verify it only once
+			if self._loops is None: self._loops = LoopCache()
+			if self._loops.proven is None: self._loops.proven = verify_OPs(self._ops, self._jumps).proven
+			self._code = decode_OPs(self._ops, self._jumps, self._loops.proven)
+
+		if self._head >= len(self._code):
+			self._status = STATUS_HALTED
+			return
+
+		if self._head < 0:
+			self._head = 0
+
+		handler, arg = self._code[self._head]
+		handler(self, machine, process_key, arg)
+		self._head += 1
+
+		if self._head >= len(self._code):
+			self._status = STATUS_HALTED
 			return
 
+	def run_tiered_step(self, machine: Machine, process_key: int, budget: int = 1) -> int:
+		if self._loops is None: self._loops = LoopCache()
+		head = self._head
+
+		if budget > 1:
+			block = self._loops.blocks.get(head)
+
+			if block is not None:
+				steps = block(self, budget)
+				if steps: return steps
+
+		self.run_step(machine, process_key)
+
+		if self._head <= head and 0 <= head < len(self._ops) and isinstance(self._ops[head], ConditionalClose):
+			self._loops.on_back_edge(self._ops, self._jumps, head)
+
+		return 1
+
+	def _run_push_data(self, machine: Machine, process_key: int, value: int):
+		self._data.append(value)
+
+	def _run_conditional_open(self, machine: Machine, process_key: int, jump: int):
+		if self._a == 0: self._head = jump
+
+	def _run_conditional_close(self, machine: Machine, process_key: int, jump: int):
+		if self._a != 0: self._head = jump
+
+	def _run_set_a(self, machine: Machine, process_key: int, _: None):
+		self._a = self._safe_get_data()
+
+	def _run_set_b(self, machine: Machine, process_key: int, _: None):
+		self._b = self._safe_get_data()
+
+	def _run_set_c(self, machine: Machine, process_key: int, _: None):
+		self._c = self._safe_get_data()
+
+	def _run_push_a(self, machine: Machine, process_key: int, _: None):
+		self._push_data(self._a)
+
+	def _run_push_b(self, machine: Machine, process_key: int, _: None):
+		self._push_data(self._b)
+
+	def _run_push_c(self, machine: Machine, process_key: int, _: None):
+		self._push_data(self._c)
+
+	def _run_constant_a(self, machine: Machine, process_key: int, value: int):
+		self._a = value
+
+	def _run_constant_b(self, machine: Machine, process_key: int, value: int):
+		self._b = value
+
+	def _run_constant_c(self, machine: Machine, process_key: int, value: int):
+		self._c = value
+
+	def _run_move_a(self, machine: Machine, process_key: int, _: None):
+		self._a = self._safe_pop_data()
+
+	def _run_move_b(self, machine: Machine, process_key: int, _: None):
+		self._b = self._safe_pop_data()
+
+	def _run_move_c(self, machine: Machine, process_key: int, _: None):
+		self._c = self._safe_pop_data()
+
+	def _run_arithmetics(self, machine: Machine, process_key: int, callback: Callable[[int, int, int], int]):
+		self._a = callback(self._a, self._b, self._c)
+
+	def _run_drop_data(self, machine: Machine, process_key: int, _: None):
+		self._data.pop() if self._data else ...
+
+	def _run_save_alt(self, machine: Machine, process_key: int, _: None):
+		if self._data:
+			if self._alt_data is None: self._alt_data = array("q")
+			self._alt_data.append(self._data.pop())
+
+	def _run_load_alt(self, machine: Machine, process_key: int, _: None):
+		self._data.append(self._alt_data.pop()) if self._alt_data else ...
+
+	def _run_halt(self, machine: Machine, process_key: int, _: None):
+		self._status = STATUS_HALTED
+
+	def _run_send_signal(self, machine: Machine, process_key: int, _: None):
+		if not machine.safe_send_signal(self._b, self._a, process_key) and machine.blocks_signal_senders:
+			self._status = STATUS_WAITING
+			self._head -= 1
+
+	def _run_pull_signal(self, machine: Machine, process_key: int, _: None):
+		self._a = machine.safe_pull_signal(process_key) if not self._frames else 0
+
+	def _run_spawn_process(self, machine: Machine, process_key: int, _: None):
+		process = Process.load(machine.safe_get_program(self._a))
+		machine.spawn_process(process, self._b)
+
+	def _run_read_process(self, machine: Machine, process_key: int, _: None):
+		self._a = parse_process_status(machine.safe_read_process(self._a))
+
+	def _run_read_RAM(self, machine: Machine, process_key: int, _: None):
+		self._a = machine.safe_read_RAM(self._a, self._b)
+
+	def _run_write_RAM(self, machine: Machine, process_key: int, _: None):
+		machine.safe_write_RAM(self._a, self._b, self._c)
+
+	def _run_clone_RAM(self, machine: Machine, process_key: int, _: None):
+		machine.safe_clone_RAM(self._a, self._b)
+
+	def _run_drop_RAM(self, machine: Machine, process_key: int, _: None):
+		machine.safe_drop_RAM(self._a)
+
+	def _run_call(self, machine: Machine, process_key: int, _: None):
+		if machine._call_frames:
+			self._call(machine, machine.safe_get_program(self._a))
+			return
+
+		self._status = STATUS_WAITING
+		child = self.load_child(machine.safe_get_program(self._a), process_key)
+		machine.spawn_process(child)
+
+	def _run_sleep(self, machine: Machine, process_key: int, _: None):
+		self._status = STATUS_SLEEPING
+		self._sleep_ticks = self._a
+
+	def _run_intrinsic(self, machine: Machine, process_key: int, callback: Callable[[Process, Machine], int]):
+		self._cost += callback(self, machine) // WORDS_PER_STEP
+
+	def _run_debug(self, machine: Machine, process_key: int, code: CodeType):
+		# a tracer already records the Debug op as it steps it, through the same filters and sampling as any other op
+		if machine._tracer is None: print(f"{self._a} {self._b} {self._c} {self._data.tolist()}")
+		exec(code, globals(), { "self": self, "machine": machine, "process_key": process_key })
+
+	def _run_no_op(self, machine: Machine, process_key: int, _: None): ...
+
+	def _run_set_a_constant_b_arithmetics(
+		self, machine: Machine, process_key: int, arg: tuple[int, Callable[[int, int, int], int]]
+	):
+		value, callback = arg
+		self._a = self._safe_get_data()
+		self._b = value
+		self._a = callback(self._a, value, self._c)
+
+	def _run_constant_b_arithmetics(
+		self, machine: Machine, process_key: int, arg: tuple[int, Callable[[int, int, int], int]]
+	):
+		value, callback = arg
+		self._b = value
+		self._a = callback(self._a, value, self._c)
+
+	def _run_drop_data_push_a(self, machine: Machine, process_key: int, _: None):
+		if self._data: self._data.pop()
+		self._push_data(self._a)
+
+	def _run_drop_data_push_data(self, machine: Machine, process_key: int, value: int):
+		if self._data: self._data[-1] = value
+		else: self._data.append(value)
+
+	def _run_not_implemented(self, machine: Machine, process_key: int, op: OP):
+		raise Exception(f"not implemented: {op}")
+
+	def _run_set_a_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._a = self._data[-1]
+
+	def _run_set_b_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._b = self._data[-1]
+
+	def _run_set_c_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._c = self._data[-1]
+
+	def _run_move_a_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._a = self._data.pop()
+
+	def _run_move_b_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._b = self._data.pop()
+
+	def _run_move_c_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._c = self._data.pop()
+
+	def _run_drop_data_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._data.pop()
+
+	def _run_save_alt_unchecked(self, machine: Machine, process_key: int, _: None):
+		if self._alt_data is None: self._alt_data = array("q")
+		self._alt_data.append(self._data.pop())
+
+	def _run_load_alt_unchecked(self, machine: Machine, process_key: int, _: None):
+		self._data.append(self._alt_data.pop())
+
+	def _run_set_a_constant_b_arithmetics_unchecked(
+		self, machine: Machine, process_key: int, arg: tuple[int, Callable[[int, int, int], int]]
+	):
+		value, callback = arg
+		self._a = self._data[-1]
+		self._b = value
+		self._a = callback(self._a, value, self._c)
+
+	def _run_drop_data_push_a_unchecked(self, machine: Machine, process_key: int, _: None):
+		try: self._data[-1] = self._a
+		except OverflowError: self._data[-1] = wrap_word(self._a)
+
+	def _run_drop_data_push_data_unchecked(self, machine: Machine, process_key: int, value: int):
+		self._data[-1] = value
+
+UNCHECKED_HANDLERS: dict[Handler, Handler] = {
+	Process._run_set_a: Process._run_set_a_unchecked,
+	Process._run_set_b: Process._run_set_b_unchecked,
+	Process._run_set_c: Process._run_set_c_unchecked,
+	Process._run_move_a: Process._run_move_a_unchecked,
+	Process._run_move_b: Process._run_move_b_unchecked,
+	Process._run_move_c: Process._run_move_c_unchecked,
+	Process._run_drop_data: Process._run_drop_data_unchecked,
+	Process._run_save_alt: Process._run_save_alt_unchecked,
+	Process._run_load_alt: Process._run_load_alt_unchecked,
+	Process._run_set_a_constant_b_arithmetics: Process._run_set_a_constant_b_arithmetics_unchecked,
+	Process._run_drop_data_push_a: Process._run_drop_data_push_a_unchecked,
+	Process._run_drop_data_push_data: Process._run_drop_data_push_data_unchecked
+}
+
 def safe_pop_RAM(ram: list[int]) -> int:
 	return ram.pop(0) if ram else 0
 
 def safe_get_OP_type(key: int) -> type[OP]:
 	return OPS[key] if 0 <= key < len(OPS) else NoOP
 
-def safe_parse_RAM(ram: list[int]) -> tuple[OP, ...]:
-	ops: list[OP] = [ ]
-	wram = ram[:]
-
-	while wram:
-		op_type = safe_get_OP_type(wram.pop(0))
-		
-		if op_type in (
-			DropData, ConditionalOpen, ConditionalClose, SaveAlt, LoadAlt, Halt,
-			SendSignal, PullSignal,
-			SpawnProcess, ReadProcess,
-			ReadRAM, WriteRAM, CloneRAM, DropRAM,
-			SetA, SetB, SetC, PushA, PushB, PushC, MoveA, MoveB, MoveC,
-			Debug
-		):
-			ops.append(op_type())
+type Words = list[int] | array | memoryview | bytes | RAM
+
+NULLARY_OPS: tuple[type[OP], ...] = (
+	DropData, ConditionalOpen, ConditionalClose, SaveAlt, LoadAlt, Halt,
+	SendSignal, PullSignal,
+	SpawnProcess, ReadProcess,
+	ReadRAM, WriteRAM, CloneRAM, DropRAM,
+	SetA, SetB, SetC, PushA, PushB, PushC, MoveA, MoveB, MoveC
+)
+
+UNARY_OPS: tuple[type[OP], ...] = (PushData, ConstantA, ConstantB, ConstantC, Arithmetics, Intrinsic)
+
+OP_ARITIES: tuple[int|None, ...] = tuple(
+	0 if op_type in NULLARY_OPS else 1 if op_type in UNARY_OPS else None
+	for op_type in OPS
+)
+
+OPCODES: dict[type[OP], tuple[int, int]] = {
+	op_type: (opcode, arity)
+	for opcode, (op_type, arity) in enumerate(zip(OPS, OP_ARITIES))
+	if arity is not None
+}
+
+def as_words(ram: Words) -> list[int] | array | memoryview:
+	if isinstance(ram, (bytes, bytearray)): return memoryview(ram).cast("q")
+	if isinstance(ram, memoryview) and ram.format != "q": return ram.cast("B").cast("q")
+	if isinstance(ram, PagedRAM): return ram.tolist()
+	if isinstance(ram, SparseRAM): return ram.code_words()
+	return ram
+
+def safe_iter_RAM(ram: Words, key: int = 0) -> Iterator[OP]:
+	words = as_words(ram)
+	size = len(words)
+	opcodes = len(OPS)
 
-		if op_type in (PushData, ConstantA, ConstantB, ConstantC, Arithmetics):
-			ops.append(op_type(safe_pop_RAM(wram)))
+	while key < size:
+		opcode = words[key]
+		key += 1
+		arity = OP_ARITIES[opcode] if 0 <= opcode < opcodes else None
 
-	return tuple(ops)
+		if arity == 0:
+			yield OPS[opcode]()
 
-def parse_OPs(ops: tuple[OP, ...]) -> list[int]:
-	ram: list[int] = [ ]
+		elif arity == 1:
+			yield OPS[opcode](words[key] if key < size else 0)
+			key += 1
 
+def safe_parse_RAM(ram: Words) -> tuple[OP, ...]:
+	return tuple(safe_iter_RAM(ram))
+
+def iter_OPs(ops: Iterable[OP]) -> Iterator[int]:
 	for op in ops:
-		if isinstance(op, (
-			DropData, ConditionalOpen, ConditionalClose, SaveAlt, LoadAlt, Halt,
-			SendSignal, PullSignal,
-			SpawnProcess, ReadProcess,
-			ReadRAM, WriteRAM, CloneRAM, DropRAM,
-			SetA, SetB, SetC, PushA, PushB, PushC, MoveA, MoveB, MoveC
-		)):
-			ram.append(OPS.index(op.__class__))
-
-		if isinstance(op, (PushData, ConstantA, ConstantB, ConstantC, Arithmetics)):
-			ram.append(OPS.index(op.__class__))
-			ram.append(op.arg)
+		encoding = OPCODES.get(op.__class__)
+		if encoding is None: continue
+		opcode, arity = encoding
+		yield opcode
+		if arity == 1: yield op.arg
 
-	return ram
+def parse_OPs(ops: Iterable[OP]) -> list[int]:
+	return list(iter_OPs(ops))
 
-@dataclass
+def encode_OPs(ops: Iterable[OP]) -> array:
+	return array("q", iter_OPs(ops))
+
+@dataclass(slots=True)
 class Machine:
 	_processes: dict[int, Process]
-	_RAMs: dict[int, list[int]]
+	_RAMs: dict[int, RAM]
+	_interpreter: Interpreter = Interpreter.MATCH
+	_quantum: int = 1
+	_programs: OrderedDict[int, tuple[int, Program]] = field(default_factory=OrderedDict, repr=False)
+	_RAM_versions: dict[int, int] = field(default_factory=dict, repr=False)
+	_program_cache_size: int = field(default=64, repr=False)
+	_program_cache_hits: int = field(default=0, repr=False)
+	_program_cache_misses: int = field(default=0, repr=False)
+	_tick: int = field(default=0, repr=False)
+	_ready: dict[int, None] = field(default_factory=dict, repr=False)
+	_ready_sorted: bool = field(default=True, repr=False)
+	_order: dict[int, int] = field(default_factory=dict, repr=False)
+	_next_order: int = field(default=0, repr=False)
+	_waiting: set[int] = field(default_factory=set, repr=False)
+	_sleeping: dict[int, int|None] = field(default_factory=dict, repr=False)
+	_timers: list[tuple[int, int]] = field(default_factory=list, repr=False)
+	_signal_capacity: int|None = field(default=None, repr=False)
+	_signal_policy: SignalPolicy = field(default=SignalPolicy.DROP_NEW, repr=False)
+	_blocked_senders: dict[int, deque[tuple[int, Process]]] = field(default_factory=dict, repr=False)
+	_profiler: Profiler|None = field(default=None, repr=False)
+	_tracer: Tracer|None = field(default=None, repr=False)
+	_sparse_RAMs: bool = field(default=False, repr=False)
+	_process_quota: Quota|None = field(default=None, repr=False)
+	_process_quotas: dict[int, Quota] = field(default_factory=dict, repr=False)
+	_machine_quota: Quota|None = field(default=None, repr=False)
+	_quota_policy: QuotaPolicy = field(default=QuotaPolicy.STOP, repr=False)
+	_throttle_ticks: int = field(default=1, repr=False)
+	_usage: dict[int, Usage] = field(default_factory=dict, repr=False)
+	_spawners: dict[int, int] = field(default_factory=dict, repr=False)
+	_last_spawned: int|None = field(default=None, repr=False)
+	_instructions: int = field(default=0, repr=False)
+	_stack_words: int = field(default=0, repr=False)
+	_stack_refs: dict[int, int] = field(default_factory=dict, repr=False)
+	_RAM_words: int = field(default=0, repr=False)
+	_stepping: Process|None = field(default=None, repr=False)
+	_stepping_size: int = field(default=0, repr=False)
+	_free_keys: list[int] = field(default_factory=list, repr=False)
+	_next_key: int = field(default=0, repr=False)
+	_generations: dict[int, int] = field(default_factory=dict, repr=False)
+	_call_frames: bool = field(default=False, repr=False)
+	_frame_count: int = field(default=0, repr=False)
+	_optimize: bool = field(default=False, repr=False)
+
+	def __post_init__(self):
+		self._RAMs = { key: self._make_RAM(ram) for key, ram in self._RAMs.items() }
+		self._recount()
+
+		for key, process in self._processes.items():
+			self._order[key] = self._next_order
+			self._next_order += 1
+			self._track(key, process)
 
 	@staticmethod
-	def new() -> Machine:
+	def new(
+		interpreter: Interpreter = Interpreter.MATCH, quantum: int = 1, program_cache_size: int = 64,
+		signal_capacity: int|None = None, signal_policy: SignalPolicy = SignalPolicy.DROP_NEW,
+		sparse_RAMs: bool = False, process_quota: Quota|None = None, machine_quota: Quota|None = None,
+		quota_policy: QuotaPolicy = QuotaPolicy.STOP, throttle_ticks: int = 1, call_frames: bool = False,
+		optimize: bool = False
+	) -> Machine:
 		return Machine(
 			{
 				0: Process.new(tuple())
 			},
 			{
 				0: [ ]
-			}
+			},
+			interpreter,
+			max(quantum, 1),
+			_program_cache_size=program_cache_size,
+			_signal_capacity=signal_capacity,
+			_signal_policy=signal_policy,
+			_sparse_RAMs=sparse_RAMs,
+			_process_quota=process_quota,
+			_machine_quota=machine_quota,
+			_quota_policy=quota_policy,
+			_throttle_ticks=max(throttle_ticks, 1),
+			_call_frames=call_frames,
+			_optimize=optimize
 		)
 	
+	def fork(self) -> Machine:
+		stacks: dict[int, array] = { }
+		processes = { key: process.fork(stacks) for key, process in self._processes.items() }
+		blocked_senders: dict[int, deque[tuple[int, Process]]] = { }
+
+		for index, senders in self._blocked_senders.items():
+			forked = deque((key, processes[key]) for key, sender in senders if self._processes.get(key) is sender)
+			if forked: blocked_senders[index] = forked
+
+		machine = Machine(
+			{ }, { key: ram.clone() for key, ram in self._RAMs.items() }, self._interpreter, self._quantum,
+			OrderedDict(self._programs), dict(self._RAM_versions), self._program_cache_size,
+			_tick=self._tick, _ready=dict(self._ready), _ready_sorted=self._ready_sorted,
+			_order=dict(self._order), _next_order=self._next_order,
+			_waiting=set(self._waiting), _sleeping=dict(self._sleeping), _timers=list(self._timers),
+			_signal_capacity=self._signal_capacity, _signal_policy=self._signal_policy,
+			_blocked_senders=blocked_senders, _sparse_RAMs=self._sparse_RAMs,
+			_process_quota=self._process_quota, _process_quotas=dict(self._process_quotas),
+			_machine_quota=self._machine_quota, _quota_policy=self._quota_policy,
+			_throttle_ticks=self._throttle_ticks,
+			_usage={ key: Usage(usage.instructions, usage.RAM_words, usage.children) for key, usage in self._usage.items() },
+			_spawners=dict(self._spawners), _instructions=self._instructions,
+			_free_keys=list(self._free_keys), _next_key=self._next_key, _generations=dict(self._generations),
+			_call_frames=self._call_frames, _optimize=self._optimize
+		)
+		machine._processes = processes
+		machine._recount()
+		return machine
+
 	def init_with(
 		self, rams: dict[int, list[int]], enabled: set[int]
 	):
 		for key, ram in rams.items():
-			self._RAMs[key] = ram
-			if key in enabled: self._processes[key] = Process.new(safe_parse_RAM(ram))
+			self.set_RAM(key, ram)
+			if key in enabled: self.spawn_process(Process.load(self.safe_get_program(key)), key)
+
+	@property
+	def program_cache_hits(self) -> int:
+		return self._program_cache_hits
+
+	@property
+	def program_cache_misses(self) -> int:
+		return self._program_cache_misses
 	
 	@property
 	def data_size(self) -> int:
-		return (
-			sum(process.data_size for process in self._processes.values())
-			+ sum(len(ram) for ram in self._RAMs.values())
-		)
+		return self._stack_words + self._RAM_words
+
+	@property
+	def stack_words(self) -> int:
+		return self._stack_words
+
+	@property
+	def RAM_words(self) -> int:
+		return self._RAM_words
+
+	@property
+	def usage(self) -> Usage:
+		return Usage(self._instructions, self._RAM_words, len(self._processes))
+
+	@property
+	def has_quotas(self) -> bool:
+		return self._process_quota is not None or self._machine_quota is not None or bool(self._process_quotas)
+
+	def get_process_usage(self, key: int) -> Usage:
+		return self._usage.get(key) or Usage()
+
+	def set_process_quota(self, key: int, quota: Quota|None):
+		if quota is None: self._process_quotas.pop(key, None)
+		else: self._process_quotas[key] = quota
+
+	def _recount(self):
+		self._stack_words = 0
+		self._stack_refs = { }
+		self._frame_count = 0
+		self._RAM_words = sum(len(ram) for ram in self._RAMs.values())
+		for process in self._processes.values(): self._count_process(process)
+
+	def _count_process(self, process: Process):
+		data = id(process._data)
+		refs = self._stack_refs.get(data, 0)
+		if refs == 0: self._stack_words += len(process._data)
+		self._stack_refs[data] = refs + 1
+		self._stack_words += process.data_size - len(process._data)
+		self._frame_count += process.call_depth
+
+	def _uncount_process(self, process: Process):
+		if process is self._stepping:
+			self._settle_step()
+			self._stepping = None
+
+		data = id(process._data)
+		refs = self._stack_refs.pop(data, 1) - 1
+		if refs > 0: self._stack_refs[data] = refs
+		else: self._stack_words -= len(process._data)
+		self._stack_words -= process.data_size - len(process._data)
+		self._frame_count -= process.call_depth
+
+	def _settle_step(self):
+		size = self._stepping.stack_size
+		self._stack_words += size - self._stepping_size
+		self._stepping_size = size
+
+	@property
+	def tick(self) -> int:
+		return self._tick
+
+	@property
+	def is_idle(self) -> bool:
+		return not self._ready
+
+	@property
+	def blocks_signal_senders(self) -> bool:
+		return self._signal_policy == SignalPolicy.BLOCK
+
+	@property
+	def profiler(self) -> Profiler|None:
+		return self._profiler
+
+	def enable_profiling(self, sample_rate: int = 64, processes: set[int]|None = None) -> Profiler:
+		self._profiler = Profiler(sample_rate, processes)
+		return self._profiler
+
+	def disable_profiling(self) -> Profiler|None:
+		profiler, self._profiler = self._profiler, None
+		return profiler
+
+	@property
+	def tracer(self) -> Tracer|None:
+		return self._tracer
+
+	def enable_tracing(
+		self, capacity: int = 4096, sample_rate: int = 1, processes: set[int]|None = None,
+		ops: set[type[OP]]|None = None, RAM_keys: set[int]|None = None
+	) -> Tracer:
+		self._tracer = Tracer(capacity, sample_rate, processes, ops, RAM_keys)
+		return self._tracer
+
+	def disable_tracing(self) -> Tracer|None:
+		tracer, self._tracer = self._tracer, None
+		return tracer
+
+	def _track(self, key: int, process: Process):
+		match process.status:
+			case ProcessStatus.RUNNING | ProcessStatus.HALTED:
+				self._make_ready(key)
+
+			case ProcessStatus.WAITING:
+				self._waiting.add(key)
+
+			case ProcessStatus.SLEEPING if process.has_signal_queued:
+				# a signal queued before the process fell asleep wakes it just like one arriving later would
+				process._status = STATUS_RUNNING
+				self._make_ready(key)
+
+			case ProcessStatus.SLEEPING | ProcessStatus.THROTTLED:
+				deadline = self._tick + process._sleep_ticks if process._sleep_ticks > 0 else None
+				self._sleeping[key] = deadline
+				if deadline is not None: heappush(self._timers, (deadline, key))
+
+	def _untrack(self, key: int):
+		self._ready.pop(key, None)
+		self._waiting.discard(key)
+		self._sleeping.pop(key, None)
+
+	def _make_ready(self, key: int):
+		if key in self._ready: return
+		if self._ready and self._order[key] < self._order[next(reversed(self._ready))]: self._ready_sorted = False
+		self._ready[key] = None
+
+	def _sort_ready(self):
+		self._ready = dict.fromkeys(sorted(self._ready, key=self._order.__getitem__))
+		self._ready_sorted = True
+
+	def _wake(self, key: int, process: Process):
+		process.status = ProcessStatus.RUNNING
+		self._untrack(key)
+		self._make_ready(key)
+
+	def _stop(self, key: int, process: Process):
+		if process.parent_process is not None and process.parent_process in self._processes:
+			parent = self._processes[process.parent_process]
+			if parent.status == ProcessStatus.WAITING: self._wake(process.parent_process, parent)
+
+		self._untrack(key)
+		self._release_signal_senders(key, None)
+
+	def _reap(self, key: int, process: Process):
+		self._stop(key, process)
+
+		if key != 0 and key in self._processes:
+			self._forget(key, self._processes.pop(key))
+			del self._order[key]
+			if 0 <= key < self._next_key: heappush(self._free_keys, key)
+
+	def _forget(self, key: int, process: Process):
+		self._uncount_process(process)
+		self._usage.pop(key, None)
+		spawner = self._spawners.pop(key, None)
+		if spawner is not None and spawner in self._usage: self._usage[spawner].children -= 1
+
+	def _block(self, key: int, process: Process):
+		if process.status == ProcessStatus.HALTED:
+			self._reap(key, process)
+
+		elif process.status == ProcessStatus.EXCEEDED:
+			self._stop(key, process)
+
+		else:
+			self._untrack(key)
+			self._track(key, process)
+
+	def _wake_sleepers(self):
+		while self._timers and self._timers[0][0] <= self._tick:
+			deadline, key = heappop(self._timers)
+			process = self._processes.get(key)
+
+			if (
+				process is not None and self._sleeping.get(key) == deadline
+				and process._status in (STATUS_SLEEPING, STATUS_THROTTLED)
+			):
+				self._wake(key, process)
 
 	def run_step(self):
-		processes = { key: process for key, process in self._processes.items() }
+		self._tick += 1
+		self._wake_sleepers()
+		if not self._ready_sorted: self._sort_ready()
+		threaded = self._interpreter == Interpreter.THREADED
+		quantum = self._quantum
+		profiler = self._profiler
+		tracer = self._tracer
+		limited = self.has_quotas
+		# profiling, tracing and quotas account for every instruction, so they keep tiered processes on the interpreter
+		tiered = self._interpreter == Interpreter.TIERED and profiler is None and tracer is None and not limited
+
+		for key, process in [ (key, self._processes[key]) for key in self._ready ]:
+			if key not in self._ready or self._processes.get(key) is not process: continue
+
+			if process._status == STATUS_RUNNING:
+				# bulk intrinsics leave the steps they cost beyond their own as debt, paid off before the process runs again
+				if process._cost >= quantum:
+					process._cost -= quantum
+					continue
+
+				self._stepping = process
+				self._stepping_size = len(process._data) + len(process._alt_data or ()) + process._frame_words
+
+				if tiered:
+					steps: int = process.run_tiered_step(self, key, quantum - process._cost)
+
+					while True:
+						while steps + process._cost < quantum and process._status == STATUS_RUNNING and self._stepping is process:
+							steps += process.run_tiered_step(self, key, quantum - steps - process._cost)
+
+						if process._status not in (STATUS_HALTED, STATUS_EXCEEDED) or not process._frames or self._stepping is not process: break
+						process._return(self)
+
+				else:
+					step = process.run_threaded_step if threaded else process.run_step
+					if profiler is not None: step = partial(profiler.run_step, process, step)
+					if tracer is not None: step = partial(tracer.run_step, process, step)
+					if limited: step = partial(self._run_limited_step, process, step)
+					step(self, key)
+					steps = 1
+
+					while True:
+						while steps + process._cost < quantum and process._status == STATUS_RUNNING and self._stepping is process:
+							step(self, key)
+							steps += 1
+
+						# a callee halting or stopped by a quota in a call frame returns to its caller, as a child process would
+						if process._status not in (STATUS_HALTED, STATUS_EXCEEDED) or not process._frames or self._stepping is not process: break
+						process._return(self)
+
+				process._cost = max(steps + process._cost - quantum, 0)
+
+				# forgetting the stepping process clears _stepping, so a process that spawned over its own key ends here
+				# and the process that replaced it is left to run
+				if self._stepping is not process: continue
+				self._stack_words += len(process._data) + len(process._alt_data or ()) + process._frame_words - self._stepping_size
+				self._stepping = None
+
+				# single-instruction ticks keep a halted process around until the next tick, as they always have
+				if quantum == 1 and process._status == STATUS_HALTED: continue
+
+			if process._status != STATUS_RUNNING: self._block(key, process)
+
+	def _exceed(self, process: Process, throttle: bool):
+		if throttle and self._quota_policy == QuotaPolicy.THROTTLE:
+			process._status = STATUS_THROTTLED
+			process._sleep_ticks = self._throttle_ticks
+
+		else:
+			process._status = STATUS_EXCEEDED
+
+	def _run_limited_step(self, process: Process, step: Callable[[Machine, int], None], machine: Machine, process_key: int):
+		quota = self._process_quotas.get(process_key, self._process_quota) or Quota()
+		limit = self._machine_quota or Quota()
+		usage = self._usage.get(process_key)
+		if usage is None: usage = self._usage[process_key] = Usage()
 
-		for key, process in processes.items():
-			match process.status:
-				case ProcessStatus.RUNNING:
-					process.run_step(self, key)
-				
-				case ProcessStatus.HALTED:
-					if process.parent_process is not None and process.parent_process in self._processes:
-						parent = self._processes[process.parent_process]
-						if parent.status == ProcessStatus.WAITING: parent.status = ProcessStatus.RUNNING
+		if (
+			(quota.instructions is not None and usage.instructions >= quota.instructions)
+			or (limit.instructions is not None and self._instructions >= limit.instructions)
+		):
+			self._exceed(process, False)
+			return
 
-					if key != 0: del self._processes[key]
+		head = max(process._head, 0)
+		op = process._ops[head] if head < len(process._ops) else None
+		growth: int = 0
+
+		match op:
+			case WriteRAM():
+				growth = max(process._b + 1 - len(self.safe_get_RAM(process._a)), 0) if process._b >= 0 else 0
 
-	def run(self):
+			case CloneRAM():
+				growth = len(self.safe_get_RAM(process._a)) - (len(self._RAMs[process._b]) if process._b in self._RAMs else 0)
+
+			case Call() | SpawnProcess():
+				if (
+					(quota.children is not None and usage.children >= quota.children)
+					or (limit.children is not None and len(self._processes) + self._frame_count >= limit.children)
+				):
+					self._exceed(process, True)
+					return
+
+		if growth > 0 and (
+			(quota.RAM_words is not None and usage.RAM_words + growth > quota.RAM_words)
+			or (limit.RAM_words is not None and self._RAM_words + growth > limit.RAM_words)
+		):
+			self._exceed(process, True)
+			return
+
+		RAM_words = self._RAM_words
+		cost = process._cost
+		self._last_spawned = None
+		step(machine, process_key)
+		usage.instructions += 1 + process._cost - cost
+		self._instructions += 1 + process._cost - cost
+		usage.RAM_words += self._RAM_words - RAM_words
+
+		if self._last_spawned is not None and isinstance(op, (Call, SpawnProcess)):
+			self._spawners[self._last_spawned] = process_key
+			usage.children += 1
+
+		if quota.stack_depth is not None and process.stack_size > quota.stack_depth:
+			self._exceed(process, False)
+
+		elif limit.stack_depth is not None:
+			if self._stepping is process: self._settle_step()
+			if self._stack_words > limit.stack_depth: self._exceed(process, False)
+
+	# ticks are virtual, so sleepers with a deadline wake as soon as nothing else is ready
+	def advance_to_next_timer(self) -> bool:
+		if self._ready: return True
+		if not self._timers: return False
+		self._tick = max(self._tick, self._timers[0][0] - 1)
+		return True
+
+	def run(self, steps: int|None = None) -> bool:
 		useless_steps: int = 0
 
 		while self._processes:
+			if steps is not None:
+				if steps <= 0: return False
+				steps -= 1
+
+			self.advance_to_next_timer()
 			self.run_step()
 
-			if not any(process.status == ProcessStatus.RUNNING for process in self._processes.values()):
+			if not self._ready:
 				useless_steps += 1
 
 			else:
 				useless_steps = 0
 
 			if useless_steps > 3:
-				return
+				return True
+
+		return True
 
 	def safe_get_process(self, key: int) -> Process:
 		return self._processes[key] if key in self._processes else self._processes[0]
 
-	def safe_get_RAM(self, key: int) -> list[int]:
+	def _make_RAM(self, ram: Words) -> RAM:
+		if isinstance(ram, (PagedRAM, SparseRAM)): return ram
+		return (SparseRAM if self._sparse_RAMs else PagedRAM).from_words(as_words(ram))
+
+	def safe_get_RAM(self, key: int) -> RAM:
 		return self._RAMs[key] if key in self._RAMs else self._RAMs[0]
 
+	def _safe_get_RAM_key(self, key: int) -> int:
+		return key if key in self._RAMs else 0
+
+	def _invalidate_RAM(self, key: int):
+		self._RAM_versions[key] = self._RAM_versions.get(key, 0) + 1
+
+	def safe_get_program(self, key: int) -> Program:
+		key = self._safe_get_RAM_key(key)
+		version = self._RAM_versions.get(key, 0)
+		entry = self._programs.get(key)
+
+		if entry is not None and entry[0] == version:
+			self._program_cache_hits += 1
+			self._programs.move_to_end(key)
+			return entry[1]
+
+		self._program_cache_misses += 1
+		ops = safe_parse_RAM(self._RAMs[key])
+		# optimized programs keep the state at every boundary op but take fewer steps, so ticks and heads differ
+		program = Program.new(optimize_OPs(ops) if self._optimize else ops)
+		if self._interpreter == Interpreter.THREADED: program.decode()
+
+		if self._program_cache_size > 0:
+			self._programs[key] = (version, program)
+			self._programs.move_to_end(key)
+			while len(self._programs) > self._program_cache_size: self._programs.popitem(last=False)
+
+		return program
+
 	def safe_read_RAM(self, ram_index: int, key: int) -> int:
-		ram = self.safe_get_RAM(ram_index)
-		return ram[key] if 0 <= key < len(ram) else 0
+		return self.safe_get_RAM(ram_index).read(key)
 	
 	def safe_write_RAM(self, ram_index: int, key: int, value: int):
-		ram = self.safe_get_RAM(ram_index)
+		ram_index = self._safe_get_RAM_key(ram_index)
+		ram = self._RAMs[ram_index]
 		if 0 <= key:
-			while key >= len(ram): ram.append(0)
-			ram[key] = value
+			size = len(ram)
+			ram.write(key, value)
+			self._RAM_words += len(ram) - size
+			self._invalidate_RAM(ram_index)
+
+	def safe_read_RAM_range(self, ram_index: int, key: int, count: int) -> list[int]:
+		return self.safe_get_RAM(ram_index).read_range(key, count)
+
+	def safe_iter_RAM_range(self, ram_index: int, key: int, count: int) -> Iterator[tuple[int, Sequence[int]]]:
+		return self.safe_get_RAM(ram_index).iter_range(key, count)
+
+	def safe_fill_RAM_range(self, ram_index: int, key: int, count: int, value: int):
+		ram_index = self._safe_get_RAM_key(ram_index)
+		self._RAMs[ram_index].fill_range(key, count, value)
+		self._invalidate_RAM(ram_index)
+
+	def safe_write_RAM_range(self, ram_index: int, key: int, words: Iterable[int]):
+		ram_index = self._safe_get_RAM_key(ram_index)
+		ram = self._RAMs[ram_index]
+		size = len(ram)
+		ram.write_range(key, words)
+		self._RAM_words += len(ram) - size
+		self._invalidate_RAM(ram_index)
 
 	def safe_clone_RAM(self, ram_index: int, new_ram_index: int):
 		ram = self.safe_get_RAM(ram_index)
-		self._RAMs[new_ram_index] = ram[:]
+		if new_ram_index in self._RAMs: self._RAM_words -= len(self._RAMs[new_ram_index])
+		self._RAMs[new_ram_index] = ram.clone()
+		self._RAM_words += len(ram)
+		self._invalidate_RAM(new_ram_index)
 
 	def safe_drop_RAM(self, index: int):
-		if index in self._RAMs and index != 0: del self._RAMs[index]
+		if index in self._RAMs and index != 0:
+			self._RAM_words -= len(self._RAMs.pop(index))
+			self._programs.pop(index, None)
+			self._invalidate_RAM(index)
 
 	def safe_read_process(self, index: int) -> ProcessStatus:
 		return self._processes[index].status if index in self._processes else ProcessStatus.INVALID
 
-	def safe_send_signal(self, process_index: int, signal: int):
-		self.safe_get_process(process_index).on_receive_signal(signal)
+	def _get_signal_capacity(self, process: Process) -> int|None:
+		return process._signal_capacity if process._signal_capacity is not None else self._signal_capacity
+
+	def _release_signal_senders(self, process_index: int, count: int|None):
+		senders = self._blocked_senders.get(process_index)
+		if senders is None: return
+
+		while senders and (count is None or count > 0):
+			key, sender = senders.popleft()
+
+			if self._processes.get(key) is sender and sender.status == ProcessStatus.WAITING:
+				self._wake(key, sender)
+				if count is not None: count -= 1
+
+		if not senders: del self._blocked_senders[process_index]
+
+	def safe_send_signal(self, process_index: int, signal: int, sender: int|None = None) -> bool:
+		process_index = process_index if process_index in self._processes else 0
+		process = self._processes[process_index]
+		capacity = self._get_signal_capacity(process)
+		count = process.signal_count
+
+		if capacity is not None and count >= capacity:
+			match self._signal_policy:
+				case SignalPolicy.DROP_NEW:
+					return False
+
+				case SignalPolicy.DROP_OLDEST:
+					if not process.has_signal_queued: return False
+					process.pull_signal()
+
+				case SignalPolicy.BLOCK:
+					if sender is not None and sender in self._processes:
+						senders = self._blocked_senders.setdefault(process_index, deque())
+						senders.append((sender, self._processes[sender]))
+
+					return False
+
+		process.on_receive_signal(signal)
+		self._stack_words += process.signal_count - count
+		if process.status == ProcessStatus.SLEEPING: self._wake(process_index, process)
+		return True
+
+	def safe_send_signals(self, process_index: int, signals: Iterable[int]) -> int:
+		process_index = process_index if process_index in self._processes else 0
+		process = self._processes[process_index]
+		capacity = self._get_signal_capacity(process)
+		count = process.signal_count
+		sent: int = 0
+
+		if capacity is None:
+			process.on_receive_signals(signals)
+			sent = process.signal_count - count
+
+		else:
+			for signal in signals:
+				if process.signal_count < capacity:
+					process.on_receive_signal(signal)
+					sent += 1
+
+				elif self._signal_policy == SignalPolicy.DROP_OLDEST and process.has_signal_queued:
+					process.pull_signal()
+					process.on_receive_signal(signal)
+					sent += 1
+
+				elif self._signal_policy == SignalPolicy.BLOCK:
+					break
+
+		self._stack_words += process.signal_count - count
+		if sent and process.status == ProcessStatus.SLEEPING: self._wake(process_index, process)
+		return sent
+
+	def safe_pull_signal(self, process_index: int) -> int:
+		process = self.safe_get_process(process_index)
+		if not process.has_signal_queued: return 0
+		signal = process.pull_signal()
+		self._stack_words -= 1
+		self._release_signal_senders(process_index if process_index in self._processes else 0, 1)
+		return signal
+
+	def safe_drain_signals(self, process_index: int) -> list[int]:
+		if process_index not in self._processes: return [ ]
+		process = self._processes[process_index]
+		signals = process.drain_signals()
+		self._stack_words -= len(signals)
+		self._release_signal_senders(process_index, None)
+		return signals
 
 	def safe_pull_signals(self, process_index: int) -> Iterator[int]:
 		if process_index in self._processes:
-			process = self._processes[process_index]
-
-			while process.has_signal_queued:
-				yield process.pull_signal()
+			while self._processes[process_index].has_signal_queued:
+				yield self.safe_pull_signal(process_index)
 
 		else:
 			return iter([ ])
 
+	def process_generation(self, key: int) -> int:
+		return self._generations.get(key, 0)
+
+	def _allocate_key(self) -> int:
+		# every free key below _next_key sits in the heap, so this hands out the lowest free key like a scan from 0 would
+		while self._free_keys:
+			key = heappop(self._free_keys)
+			if key not in self._processes: return key
+
+		while self._next_key in self._processes: self._next_key += 1
+		self._next_key += 1
+		return self._next_key - 1
+
 	def spawn_process(self, process: Process, process_index: int|None = None):
 		if process_index is None:
-			process_index = 0
-			while process_index in self._processes: process_index += 1
+			process_index = self._allocate_key()
 
-		self._processes[process_index] = process
+		self._generations[process_index] = self._generations.get(process_index, 0) + 1
+
+		if process_index not in self._processes:
+			self._order[process_index] = self._next_order
+			self._next_order += 1
 
-	def set_RAM(self, key: int, ram: list[int]):
-		self._RAMs[key] = ram
+		else:
+			self._forget(process_index, self._processes[process_index])
+
+		if process.status in (ProcessStatus.RUNNING, ProcessStatus.HALTED):
+			self._waiting.discard(process_index)
+			self._sleeping.pop(process_index, None)
+
+		else:
+			self._untrack(process_index)
+
+		self._processes[process_index] = process
+		self._count_process(process)
+		self._last_spawned = process_index
+		self._track(process_index, process)
+
+	def spawn_processes(self, program: Program, stacks: Iterable[Iterable[int]]) -> list[int]:
+		if self._interpreter == Interpreter.THREADED: program.decode()
+		keys: list[int] = [ ]
+
+		for stack in stacks:
+			key = self._allocate_key()
+			process = Process.load(program)
+			process._data.extend(stack)
+			self._generations[key] = self._generations.get(key, 0) + 1
+			self._order[key] = self._next_order
+			self._next_order += 1
+			self._processes[key] = process
+			self._count_process(process)
+			self._make_ready(key)
+			keys.append(key)
+
+		return keys
+
+	def set_RAM(self, key: int, ram: Words):
+		if key in self._RAMs: self._RAM_words -= len(self._RAMs[key])
+		self._RAMs[key] = self._make_RAM(ram)
+		self._RAM_words += len(self._RAMs[key])
+		self._invalidate_RAM(key)
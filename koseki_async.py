@@ -0,0 +1,151 @@
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+
+from koseki import Machine
+
+SLICE_TICKS: int = 256
+
+@dataclass
+class MachineRuntime:
+	machine: Machine
+	slice_ticks: int = SLICE_TICKS
+	ticks: int = 0
+	_running: bool = field(default=False, repr=False)
+	_wakeup: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+	_progress: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+	@property
+	def running(self) -> bool:
+		return self._running
+
+	def run_slice(self) -> int:
+		machine = self.machine
+		ticks: int = 0
+
+		while ticks < self.slice_ticks:
+			if not machine.advance_to_next_timer(): break
+			machine.run_step()
+			ticks += 1
+
+		self.ticks += ticks
+		return ticks
+
+	def _notify(self):
+		progress, self._progress = self._progress, asyncio.Event()
+		progress.set()
+
+	async def wait_progress(self):
+		await self._progress.wait()
+
+	async def run(self):
+		self._running = True
+
+		try:
+			while self._running:
+				ticks = self.run_slice()
+				self._notify()
+
+				if ticks:
+					await asyncio.sleep(0)
+					continue
+
+				self._wakeup.clear()
+				await self._wakeup.wait()
+
+		finally:
+			self._running = False
+			self._notify()
+
+	def stop(self):
+		self._running = False
+		self._wakeup.set()
+
+	def post_signal(self, process_index: int, signal: int) -> bool:
+		sent = self.machine.safe_send_signal(process_index, signal)
+		self._wakeup.set()
+		return sent
+
+	def post_signals(self, process_index: int, signals: Iterable[int]) -> int:
+		sent = self.machine.safe_send_signals(process_index, signals)
+		self._wakeup.set()
+		return sent
+
+	async def send_signal(self, process_index: int, signal: int) -> bool:
+		# a full queue under the blocking policy holds the sender back until the machine makes progress
+		while not self.post_signal(process_index, signal):
+			if not self.machine.blocks_signal_senders or not self._running: return False
+			await self.wait_progress()
+
+		return True
+
+	async def send_signals(self, process_index: int, signals: Iterable[int]) -> int:
+		sent: int = 0
+
+		for signal in signals:
+			if not await self.send_signal(process_index, signal): break
+			sent += 1
+
+		return sent
+
+	def _has_signal(self, process_index: int) -> bool:
+		process = self.machine._processes.get(process_index)
+		return process is not None and process.has_signal_queued
+
+	async def receive_signal(self, process_index: int) -> int:
+		while not self._has_signal(process_index): await self.wait_progress()
+		signal = self.machine.safe_pull_signal(process_index)
+		self._wakeup.set()
+		return signal
+
+	async def receive_signals(self, process_index: int) -> list[int]:
+		while not self._has_signal(process_index): await self.wait_progress()
+		signals = self.machine.safe_drain_signals(process_index)
+		self._wakeup.set()
+		return signals
+
+async def _run_command(runtime: MachineRuntime, words: list[str]) -> str:
+	match words:
+		case [ "send", process, *signals ] if signals:
+			return f"sent {await runtime.send_signals(int(process), map(int, signals))}"
+
+		case [ "receive", process ]:
+			return f"signal {await runtime.receive_signal(int(process))}"
+
+		case [ "drain", process ]:
+			return " ".join(("signals", *map(str, await runtime.receive_signals(int(process)))))
+
+		case [ "status", process ]:
+			return f"status {runtime.machine.safe_read_process(int(process)).value}"
+
+		case _:
+			raise ValueError(f"unknown command {" ".join(words)!r}")
+
+async def serve_stream(runtime: MachineRuntime, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+	try:
+		while line := await reader.readline():
+			words = line.decode().split()
+			if not words: continue
+
+			try: reply = await _run_command(runtime, words)
+			except ValueError as error: reply = f"error {error}"
+
+			writer.write(f"{reply}\n".encode())
+			await writer.drain()
+
+	finally:
+		writer.close()
+
+async def serve_unix(runtime: MachineRuntime, path: Path|str) -> asyncio.Server:
+	return await asyncio.start_unix_server(partial(serve_stream, runtime), path)
+
+async def serve_pipe(runtime: MachineRuntime, read_fd: int, write_fd: int):
+	loop = asyncio.get_running_loop()
+	reader = asyncio.StreamReader()
+	await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), open(read_fd, "rb", buffering=0))
+	transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, open(write_fd, "wb", buffering=0))
+	writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+	await serve_stream(runtime, reader, writer)
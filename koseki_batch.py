@@ -0,0 +1,110 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from os import cpu_count
+from typing import Iterable
+
+from koseki import Interpreter, Machine, Quota, QuotaPolicy, parse_process_status
+from koseki_ram import RAM
+
+@dataclass
+class MachineSpec:
+	rams: dict[int, list[int]]
+	enabled: set[int]
+	steps: int
+	interpreter: Interpreter = Interpreter.MATCH
+	quantum: int = 1
+	sparse_RAMs: bool = False
+	process_quota: Quota|None = None
+	machine_quota: Quota|None = None
+	quota_policy: QuotaPolicy = QuotaPolicy.STOP
+	call_frames: bool = False
+	optimize: bool = False
+
+@dataclass
+class ProcessResult:
+	a: int
+	b: int
+	c: int
+	head: int
+	status: int
+	data: list[int]
+	parent_process: int|None
+
+@dataclass
+class RAMDiff:
+	size: int
+	changes: dict[int, int] = field(default_factory=dict)
+
+@dataclass
+class MachineResult:
+	processes: dict[int, ProcessResult]
+	RAMs: dict[int, RAMDiff|None]
+	ticks: int
+	idle: bool
+	error: str|None = None
+
+# words past the input image that are still zero are implied by the size, so they are left out of the changes
+def diff_RAM(before: list[int], after: RAM) -> RAMDiff|None:
+	shared = min(len(before), len(after))
+	changes = {
+		key: value for key, (old, value) in enumerate(zip(before[:shared], after.read_range(0, shared)))
+		if old != value
+	}
+
+	# sparse RAMs only hand back their stored pages, so a far write never walks the gap before it
+	for start, words in after.iter_range(shared, len(after) - shared):
+		changes.update((key, value) for key, value in enumerate(words, start) if value != 0)
+
+	if not changes and len(before) == len(after): return None
+	return RAMDiff(len(after), changes)
+
+def run_spec(spec: MachineSpec) -> MachineResult:
+	machine = Machine.new(
+		spec.interpreter, spec.quantum, sparse_RAMs=spec.sparse_RAMs,
+		process_quota=spec.process_quota, machine_quota=spec.machine_quota, quota_policy=spec.quota_policy,
+		call_frames=spec.call_frames, optimize=spec.optimize
+	)
+	machine.init_with({ key: list(ram) for key, ram in spec.rams.items() }, spec.enabled)
+	error: str|None = None
+	idle: bool = False
+
+	try:
+		idle = machine.run(spec.steps)
+
+	except Exception as exception:
+		error = f"{exception.__class__.__name__}: {exception}"
+
+	processes = {
+		key: ProcessResult(
+			process._a, process._b, process._c, process._head,
+			parse_process_status(process.status), list(process._data), process.parent_process
+		)
+		for key, process in machine._processes.items()
+	}
+	RAMs: dict[int, RAMDiff|None] = { }
+
+	for key in sorted(spec.rams.keys() | machine._RAMs.keys()):
+		if key not in machine._RAMs:
+			RAMs[key] = None
+			continue
+
+		diff = diff_RAM(spec.rams.get(key, [ ]), machine._RAMs[key])
+		if diff is not None: RAMs[key] = diff
+
+	return MachineResult(processes, RAMs, machine.tick, idle, error)
+
+def run_batch(
+	specs: Iterable[MachineSpec], workers: int|None = None, chunksize: int|None = None
+) -> list[MachineResult]:
+	specs = list(specs)
+	workers = workers if workers is not None else cpu_count() or 1
+
+	if workers <= 1 or len(specs) <= 1:
+		return [ run_spec(spec) for spec in specs ]
+
+	if chunksize is None:
+		chunksize = max(1, len(specs)//(workers*4))
+
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		return list(executor.map(run_spec, specs, chunksize=chunksize))
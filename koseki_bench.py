@@ -0,0 +1,325 @@
+from __future__ import annotations
+import gc
+import json
+import tracemalloc
+from argparse import ArgumentParser
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from random import Random
+from time import perf_counter
+from typing import Callable
+from rich.console import Console
+from rich.table import Table
+
+from koseki import Interpreter, Machine, Process, Program, OPCODES, encode_OPs, parse_OPs, safe_parse_RAM
+from koseki_lockstep import run_lockstep
+from koseki_ops import *
+
+BASELINES: Path = Path(__file__).with_name("koseki_bench.json")
+MEMORY_SLACK: int = 64*1024
+
+@dataclass
+class Benchmark:
+	name: str
+	prepare: Callable[[Interpreter], Callable[[], int]]
+
+@dataclass
+class BenchmarkResult:
+	name: str
+	steps: int
+	seconds: float
+	steps_per_second: float
+	peak_memory: int
+
+def countdown(count: int, body: tuple[OP, ...]) -> tuple[OP, ...]:
+	return (
+		PushData(count), ConstantA(true),
+		ConditionalOpen(),
+		*body,
+		SetA(), ConstantB(1), Arithmetics(get_function("Substraction")),
+		DropData(), PushA(),
+		ConditionalClose(),
+		DropData()
+	)
+
+IS_PRIME_OPS: tuple[OP, ...] = (
+	SetC(),
+	ConstantA(true),
+	ConditionalOpen(),
+
+	SetA(), ConstantB(1), Arithmetics(get_function("Substraction")),
+	DropData(), PushA(),
+
+	PushC(), MoveA(), SetB(), Arithmetics(get_function("Modulo")),
+	ConstantB(0), Arithmetics(get_function("==")),
+	ConditionalOpen(),
+	DropData(), ConstantA(false), PushA(), Halt(),
+	ConditionalClose(),
+
+	SetA(), ConstantB(2), Arithmetics(get_function("!=")),
+	ConditionalClose(),
+	DropData(), PushData(true),
+)
+
+def prime_machine(bound: int, interpreter: Interpreter, call_frames: bool = False) -> Machine:
+	IS_PRIME: int = 0
+	main_ops = (
+		PushData(2),
+		ConstantA(true),
+		ConditionalOpen(),
+
+		SetA(), ConstantB(1), Arithmetics(get_function("Addition")),
+		DropData(), PushA(),
+
+		PushA(), ConstantA(IS_PRIME), Call(),
+		MoveA(),
+		ConditionalOpen(),
+		SetA(), ConstantB(0), SendSignal(),
+		ConstantA(false),
+		ConditionalClose(),
+
+		SetA(), ConstantB(bound), Arithmetics(get_function("<")),
+		ConditionalClose(),
+	)
+	machine = Machine.new(interpreter, call_frames=call_frames)
+	machine.set_RAM(IS_PRIME, parse_OPs(IS_PRIME_OPS))
+	machine.spawn_process(Process.new(main_ops), 0)
+	return machine
+
+def prime_sweep(count: int) -> list[Process]:
+	program = Program.new(IS_PRIME_OPS)
+	processes: list[Process] = [ ]
+
+	for candidate in range(3, count + 3):
+		process = Process.load(program)
+		process._data.append(candidate)
+		processes.append(process)
+
+	return processes
+
+def sweep_machine(count: int, interpreter: Interpreter) -> Machine:
+	machine = Machine.new(interpreter)
+	for key, process in enumerate(prime_sweep(count), 1): machine.spawn_process(process, key)
+	return machine
+
+def loops_machine(depth: int, count: int, interpreter: Interpreter, quantum: int = 1) -> Machine:
+	ops: tuple[OP, ...] = ( PushA(), DropData() )
+	for _ in range(depth): ops = countdown(count, ops)
+	machine = Machine.new(interpreter, quantum)
+	machine.spawn_process(Process.new(ops), 0)
+	return machine
+
+def call_machine(count: int, interpreter: Interpreter, call_frames: bool = False) -> Machine:
+	CHILD: int = 1
+	machine = Machine.new(interpreter, call_frames=call_frames)
+	machine.set_RAM(CHILD, parse_OPs(( ConstantB(1), ConstantC(2) )))
+	machine.spawn_process(Process.new(countdown(count, ( ConstantA(CHILD), Call() ))), 0)
+	return machine
+
+def spawn_machine(count: int, interpreter: Interpreter) -> Machine:
+	CHILD: int = 1
+	machine = Machine.new(interpreter)
+	machine.set_RAM(CHILD, parse_OPs(( ConstantB(1), ConstantC(2), PushB() )))
+	machine.spawn_process(Process.new(countdown(count, ( SetB(), ConstantA(CHILD), SpawnProcess() ))), 0)
+	return machine
+
+def ping_pong_machine(count: int, interpreter: Interpreter) -> Machine:
+	ping = countdown(count, (
+		SetA(), ConstantB(1), SendSignal(),
+		ConstantA(true),
+		ConditionalOpen(),
+		PullSignal(), ConstantB(0), Arithmetics(get_function("==")),
+		ConditionalClose()
+	))
+	pong = (
+		PushData(0), ConstantA(true),
+		ConditionalOpen(),
+		ConstantA(true),
+		ConditionalOpen(),
+		DropData(), PullSignal(), PushA(), ConstantB(0), Arithmetics(get_function("==")),
+		ConditionalClose(),
+		ConstantA(1), ConstantB(0), SendSignal(),
+		SetA(), ConstantB(1), Arithmetics(get_function("!=")),
+		ConditionalClose()
+	)
+	machine = Machine.new(interpreter)
+	machine.spawn_process(Process.new(ping), 0)
+	machine.spawn_process(Process.new(pong), 1)
+	return machine
+
+def RAM_machine(count: int, size: int, interpreter: Interpreter) -> Machine:
+	SOURCE: int = 1
+	COPY: int = 2
+	machine = Machine.new(interpreter)
+	machine.set_RAM(SOURCE, [ 0 ]*size)
+	machine.spawn_process(Process.new(countdown(count, (
+		SetB(), SetC(), ConstantA(SOURCE), WriteRAM(),
+		ConstantB(COPY), CloneRAM(),
+		ConstantA(COPY), SetB(), ReadRAM()
+	))), 0)
+	return machine
+
+def random_image(size: int, seed: int = 0) -> list[int]:
+	random = Random(seed)
+	encodings = list(OPCODES.values())
+	image: list[int] = [ ]
+
+	while len(image) < size:
+		opcode, arity = random.choice(encodings)
+		image.append(opcode)
+		if arity == 1: image.append(random.randrange(-2**31, 2**31))
+
+	return image
+
+def machine_benchmark(name: str, build: Callable[[Interpreter], Machine]) -> Benchmark:
+	def prepare(interpreter: Interpreter) -> Callable[[], int]:
+		machine = build(interpreter)
+		profiler = machine.enable_profiling(0)
+		machine.run()
+		steps = sum(profiler.instructions.values())
+
+		def run() -> int:
+			build(interpreter).run()
+			return steps
+
+		return run
+
+	return Benchmark(name, prepare)
+
+def lockstep_benchmark(name: str, count: int) -> Benchmark:
+	def prepare(interpreter: Interpreter) -> Callable[[], int]:
+		machine = sweep_machine(count, interpreter)
+		profiler = machine.enable_profiling(0)
+		machine.run()
+		steps = sum(profiler.instructions.values())
+
+		def run() -> int:
+			run_lockstep(prime_sweep(count), steps, lambda: Machine.new(interpreter))
+			return steps
+
+		return run
+
+	return Benchmark(name, prepare)
+
+def image_benchmark(name: str, size: int) -> Benchmark:
+	def prepare(_: Interpreter) -> Callable[[], int]:
+		image = random_image(size)
+
+		def run() -> int:
+			ops = safe_parse_RAM(image)
+			encoded = encode_OPs(ops)
+			safe_parse_RAM(encoded.tobytes())
+			return len(image) + 2*len(encoded)
+
+		return run
+
+	return Benchmark(name, prepare)
+
+BENCHMARKS: tuple[Benchmark, ...] = (
+	machine_benchmark("primes 100", lambda interpreter: prime_machine(100, interpreter)),
+	machine_benchmark("primes 200", lambda interpreter: prime_machine(200, interpreter)),
+	machine_benchmark("primes 400", lambda interpreter: prime_machine(400, interpreter)),
+	machine_benchmark("primes 400, call frames", lambda interpreter: prime_machine(400, interpreter, True)),
+	machine_benchmark("conditional loops", lambda interpreter: loops_machine(3, 30, interpreter)),
+	machine_benchmark("conditional loops, quantum 64", lambda interpreter: loops_machine(3, 30, interpreter, 64)),
+	machine_benchmark("call storm", lambda interpreter: call_machine(5000, interpreter)),
+	machine_benchmark("call storm, call frames", lambda interpreter: call_machine(5000, interpreter, True)),
+	machine_benchmark("spawn storm", lambda interpreter: spawn_machine(5000, interpreter)),
+	machine_benchmark("signal ping-pong", lambda interpreter: ping_pong_machine(3000, interpreter)),
+	machine_benchmark("RAM writes and clones", lambda interpreter: RAM_machine(3000, 256, interpreter)),
+	machine_benchmark("primes sweep", lambda interpreter: sweep_machine(300, interpreter)),
+	lockstep_benchmark("lockstep primes sweep", 300),
+	image_benchmark("parse and encode image", 200000),
+)
+
+def run_benchmark(benchmark: Benchmark, interpreter: Interpreter, repeat: int) -> BenchmarkResult:
+	run = benchmark.prepare(interpreter)
+	seconds: float = float("inf")
+	steps: int = 0
+
+	for _ in range(max(repeat, 1)):
+		gc.collect()
+		start = perf_counter()
+		steps = run()
+		seconds = min(seconds, perf_counter() - start)
+
+	tracemalloc.start()
+	try: run()
+	finally:
+		peak_memory = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+	return BenchmarkResult(benchmark.name, steps, seconds, steps/seconds if seconds > 0 else 0.0, peak_memory)
+
+def load_baselines(path: Path) -> dict[str, dict[str, dict]]:
+	return json.loads(path.read_text()) if path.exists() else { }
+
+def save_baselines(path: Path, baselines: dict[str, dict[str, dict]]):
+	path.write_text(json.dumps(baselines, indent=4, sort_keys=True) + "\n")
+
+def find_regressions(
+	results: list[BenchmarkResult], baselines: dict[str, dict], threshold: float
+) -> list[str]:
+	regressions: list[str] = [ ]
+
+	for result in results:
+		baseline = baselines.get(result.name)
+		if baseline is None: continue
+
+		if result.steps_per_second < baseline["steps_per_second"]*(1 - threshold):
+			regressions.append(
+				f"{result.name}: {result.steps_per_second:,.0f} steps/s"
+				f" against {baseline["steps_per_second"]:,.0f}"
+			)
+
+		if result.peak_memory > baseline["peak_memory"]*(1 + threshold) + MEMORY_SLACK:
+			regressions.append(
+				f"{result.name}: {result.peak_memory:,} bytes peak"
+				f" against {baseline["peak_memory"]:,}"
+			)
+
+	return regressions
+
+def main() -> int:
+	parser = ArgumentParser(description="benchmark the Koseki VM")
+	parser.add_argument("names", nargs="*", help="only run benchmarks with these names")
+	parser.add_argument("--interpreter", choices=[ interpreter.value for interpreter in Interpreter ], default=Interpreter.MATCH.value)
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+	parser.add_argument("--baselines", type=Path, default=BASELINES)
+	parser.add_argument("--save", action="store_true", help="store these results as the new baselines")
+	arguments = parser.parse_args()
+
+	console = Console()
+	interpreter = Interpreter(arguments.interpreter)
+	benchmarks = [ benchmark for benchmark in BENCHMARKS if not arguments.names or benchmark.name in arguments.names ]
+	baselines = load_baselines(arguments.baselines)
+	interpreter_baselines = baselines.get(interpreter.value, { })
+	results: list[BenchmarkResult] = [ ]
+
+	table = Table("benchmark", "steps", "seconds", "steps/s", "baseline steps/s", "peak memory", title=f"koseki ({interpreter.value})")
+
+	for benchmark in benchmarks:
+		result = run_benchmark(benchmark, interpreter, arguments.repeat)
+		results.append(result)
+		baseline = interpreter_baselines.get(result.name)
+		table.add_row(
+			result.name, f"{result.steps:,}", f"{result.seconds:.4f}", f"{result.steps_per_second:,.0f}",
+			f"{baseline["steps_per_second"]:,.0f}" if baseline else "-", f"{result.peak_memory:,}"
+		)
+
+	console.print(table)
+
+	if arguments.save:
+		interpreter_baselines.update({ result.name: asdict(result) for result in results })
+		baselines[interpreter.value] = interpreter_baselines
+		save_baselines(arguments.baselines, baselines)
+		console.print(f"saved baselines to {arguments.baselines}")
+		return 0
+
+	regressions = find_regressions(results, interpreter_baselines, arguments.threshold)
+	for regression in regressions: console.print(f"[red]regression[/red] {regression}")
+	return 1 if regressions else 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
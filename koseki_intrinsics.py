@@ -0,0 +1,181 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterator, Sequence
+
+if TYPE_CHECKING:
+	from koseki import Machine, Process
+
+WORDS_PER_STEP: int = 64
+
+@dataclass
+class BulkFunction:
+	callback: Callable[[Process, Machine], int]
+	name: str
+
+type BulkLibrary = tuple[BulkFunction, ...]
+
+def _stack_count(process: Process) -> int:
+	return min(max(process._c, 0), len(process._data))
+
+def _stack_window(process: Process) -> array:
+	return process._data[len(process._data) - _stack_count(process):]
+
+# bulk RAM intrinsics only touch words the RAM already has, so they never grow it
+def _RAM_window(machine: Machine, ram_index: int, key: int, count: int) -> tuple[int, int]:
+	size = len(machine.safe_get_RAM(ram_index))
+	start = min(max(key, 0), size)
+	return start, max(min(key + count, size), start)
+
+# sparse RAMs only hand back the pages they store, so the words between chunks count as zeros
+def _RAM_chunks(process: Process, machine: Machine) -> tuple[int, int, Iterator[tuple[int, Sequence[int]]]]:
+	start, stop = _RAM_window(machine, process._a, process._b, process._c)
+	return start, stop, machine.safe_iter_RAM_range(process._a, start, stop - start)
+
+def _RAM_extreme(process: Process, machine: Machine, pick: Callable[..., int]) -> int:
+	start, stop, chunks = _RAM_chunks(process, machine)
+	covered: int = 0
+	extremes: list[int] = [ ]
+
+	for _, words in chunks:
+		covered += len(words)
+		extremes.append(pick(words))
+
+	if covered < stop - start: extremes.append(0)
+	process._a = pick(extremes, default=0)
+	return stop - start
+
+def _stack_sum(process: Process, machine: Machine) -> int:
+	words = _stack_window(process)
+	process._a = sum(words)
+	return len(words)
+
+def _stack_min(process: Process, machine: Machine) -> int:
+	words = _stack_window(process)
+	process._a = min(words, default=0)
+	return len(words)
+
+def _stack_max(process: Process, machine: Machine) -> int:
+	words = _stack_window(process)
+	process._a = max(words, default=0)
+	return len(words)
+
+def _stack_find(process: Process, machine: Machine) -> int:
+	words = _stack_window(process)
+	words.reverse()
+
+	try: process._a = words.index(process._b)
+	except (ValueError, OverflowError): process._a = -1
+
+	return len(words)
+
+def _stack_sort(process: Process, machine: Machine) -> int:
+	count = _stack_count(process)
+	data = process._data
+	data[len(data) - count:] = array("q", sorted(data[len(data) - count:]))
+	return count
+
+def _RAM_sum(process: Process, machine: Machine) -> int:
+	start, stop, chunks = _RAM_chunks(process, machine)
+	process._a = sum(sum(words) for _, words in chunks)
+	return stop - start
+
+def _RAM_min(process: Process, machine: Machine) -> int:
+	return _RAM_extreme(process, machine, min)
+
+def _RAM_max(process: Process, machine: Machine) -> int:
+	return _RAM_extreme(process, machine, max)
+
+def _RAM_find(process: Process, machine: Machine) -> int:
+	start, stop, chunks = _RAM_chunks(process, machine)
+	value = process._safe_get_data()
+	key = start
+	process._a = -1
+
+	for chunk_start, words in chunks:
+		if value == 0 and chunk_start > key: break
+
+		try:
+			process._a = chunk_start + words.index(value)
+			return stop - start
+
+		except ValueError:
+			key = chunk_start + len(words)
+
+	if value == 0 and key < stop: process._a = key
+	return stop - start
+
+def _RAM_fill(process: Process, machine: Machine) -> int:
+	start, stop = _RAM_window(machine, process._a, process._b, process._c)
+	if stop > start: machine.safe_fill_RAM_range(process._a, start, stop - start, process._safe_get_data())
+	process._a = stop - start
+	return stop - start
+
+def _RAM_sort(process: Process, machine: Machine) -> int:
+	ram_index = process._a
+	start, stop, chunks = _RAM_chunks(process, machine)
+	chunks = [ words for _, words in chunks ]
+	count = sum(len(words) for words in chunks)
+
+	if count == stop - start:
+		if count: machine.safe_write_RAM_range(ram_index, start, sorted(chain.from_iterable(chunks)))
+
+	# zeros sit between the negative and positive words, so only the stored non-zero words need sorting
+	else:
+		words = sorted(word for word in chain.from_iterable(chunks) if word != 0)
+		split = bisect_left(words, 0)
+		machine.safe_fill_RAM_range(ram_index, start, stop - start, 0)
+		machine.safe_write_RAM_range(ram_index, start, words[:split])
+		machine.safe_write_RAM_range(ram_index, stop - len(words) + split, words[split:])
+
+	process._a = stop - start
+	return stop - start
+
+def _RAM_copy(process: Process, machine: Machine) -> int:
+	data = process._data
+	target = data[-1] if data else 0
+	target_key = data[-2] if len(data) > 1 else 0
+	start, stop = _RAM_window(machine, process._a, process._b, process._c)
+	shift = target_key - process._b
+	target_start, target_stop = _RAM_window(machine, target, start + shift, stop - start)
+	count = target_stop - target_start
+	# the chunks are copies taken before anything is written, so overlapping ranges copy like memmove
+	chunks = list(machine.safe_iter_RAM_range(process._a, target_start - shift, count))
+	key = target_start
+
+	for chunk_start, words in chunks:
+		if chunk_start + shift > key: machine.safe_fill_RAM_range(target, key, chunk_start + shift - key, 0)
+		machine.safe_write_RAM_range(target, chunk_start + shift, words)
+		key = chunk_start + shift + len(words)
+
+	if key < target_stop: machine.safe_fill_RAM_range(target, key, target_stop - key, 0)
+	process._a = count
+	return count
+
+INTRINSICS: BulkLibrary = (
+	BulkFunction(_stack_sum, "Stack sum"),
+	BulkFunction(_stack_min, "Stack min"),
+	BulkFunction(_stack_max, "Stack max"),
+	BulkFunction(_stack_find, "Stack find"),
+	BulkFunction(_stack_sort, "Stack sort"),
+
+	BulkFunction(_RAM_sum, "RAM sum"),
+	BulkFunction(_RAM_min, "RAM min"),
+	BulkFunction(_RAM_max, "RAM max"),
+	BulkFunction(_RAM_find, "RAM find"),
+	BulkFunction(_RAM_fill, "RAM fill"),
+	BulkFunction(_RAM_sort, "RAM sort"),
+	BulkFunction(_RAM_copy, "RAM copy")
+)
+
+def safe_get_intrinsic(code: int) -> BulkFunction:
+	return INTRINSICS[code] if 0 <= code < len(INTRINSICS) else INTRINSICS[0]
+
+def get_intrinsic(name: str) -> int:
+	for key, function in enumerate(INTRINSICS):
+		if function.name == name:
+			return key
+
+	raise Exception(f"couldn't find intrinsic {name}")
@@ -0,0 +1,226 @@
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
+
+from koseki_ops import *
+from koseki_optimize import REGISTERS
+from koseki_ram import WORD_MIN, WORD_MAX, wrap_word
+from koseki_verify import verify_OPs
+
+if TYPE_CHECKING:
+	from koseki import Process
+
+type Block = Callable[[Process, int], int]
+
+HOT_LOOP: int = 16
+
+COMPILED_OPS: tuple[type[OP], ...] = (
+	NoOP, PushData, DropData, ConditionalOpen, ConditionalClose, Arithmetics, SaveAlt, LoadAlt, Halt,
+	SetA, SetB, SetC, PushA, PushB, PushC,
+	ConstantA, ConstantB, ConstantC,
+	MoveA, MoveB, MoveC,
+	*SUPERINSTRUCTIONS
+)
+
+OPERATORS: dict[str, str] = {
+	"Addition": "a = a + b",
+	"Multiplication": "a = a*b",
+	"Substraction": "a = a - b",
+	"Constant true": f"a = {true}",
+	">": "a = 1 if a > b else 0",
+	">=": "a = 1 if a >= b else 0",
+	"<": "a = 1 if a < b else 0",
+	"<=": "a = 1 if a <= b else 0",
+	"==": "a = 1 if a == b else 0",
+	"!=": "a = 1 if a != b else 0"
+}
+
+@dataclass
+class LoopCache:
+	heat: dict[int, int] = field(default_factory=dict)
+	blocks: dict[int, Block|None] = field(default_factory=dict)
+	proven: tuple[bool, ...]|None = None
+
+	def on_back_edge(self, ops: tuple[OP, ...], jumps: tuple[int, ...], close_key: int):
+		entry = jumps[close_key] + 1
+		if entry in self.blocks: return
+		heat = self.heat.get(close_key, 0) + 1
+		self.heat[close_key] = heat
+
+		if heat >= HOT_LOOP:
+			if self.proven is None: self.proven = verify_OPs(ops, jumps).proven
+			self.blocks[entry] = compile_loop(ops, jumps, jumps[close_key], close_key, self.proven)
+			del self.heat[close_key]
+
+class _Emitter:
+	def __init__(
+		self, ops: tuple[OP, ...], jumps: tuple[int, ...], halted: int,
+		get_function: Callable[[int, Library], Function], proven: tuple[bool, ...]|None = None
+	):
+		self.ops = ops
+		self.jumps = jumps
+		self.halted = halted
+		self.get_function = get_function
+		self.proven = proven if proven is not None else (False, )*len(ops)
+		self.lines: list[str] = [ ]
+		self.names: dict[str, object] = { "array": array, "wrap_word": wrap_word }
+
+	def emit(self, indent: int, line: str):
+		self.lines.append("\t"*indent + line)
+
+	def exit(self, indent: int, head: int, steps: str, halted: bool = False):
+		self.emit(indent, "process._a = a; process._b = b; process._c = c")
+		if halted or head >= len(self.ops): self.emit(indent, f"process._status = {self.halted}")
+		self.emit(indent, f"process._head = {head}")
+		self.emit(indent, f"return {steps}")
+
+	def push(self, indent: int, value: str):
+		self.emit(indent, f"append({value} if {WORD_MIN} <= {value} <= {WORD_MAX} else wrap_word({value}))")
+
+	def arithmetics(self, indent: int, key: int, offset: int, code: int):
+		function = self.get_function(code, ARITHMETICS)
+
+		match function.name:
+			case "Identity": ...
+			case name if name in OPERATORS: self.emit(indent, OPERATORS[name])
+
+			case "Division":
+				self.emit(indent, "try: a = 999 if b == 0 else int(a/b)")
+				self.emit(indent, "except OverflowError:")
+				self.exit(indent + 1, key, f"n + {offset}")
+
+			case "Modulo":
+				self.emit(indent, "if b == 0:")
+				self.exit(indent + 1, key, f"n + {offset}")
+				self.emit(indent, "a = a % b")
+
+			case _:
+				self.names[f"function_{key}"] = function.callback
+				self.emit(indent, f"a = function_{key}(a, b, c)")
+
+	def op(self, indent: int, key: int, offset: int):
+		op = self.ops[key]
+		# proven ops have their stack depth guaranteed by the verifier, so the emptiness guards go
+		proven = self.proven[key]
+		top = "data[-1]" if proven else "data[-1] if data else 0"
+		drop = "pop()" if proven else "if data: pop()"
+
+		match op:
+			case NoOP() | ConditionalOpen(): ...
+			case PushData(arg=value): self.emit(indent, f"append({wrap_word(value)})")
+			case DropData(): self.emit(indent, drop)
+			case SetA() | SetB() | SetC(): self.emit(indent, f"{REGISTERS[op.__class__]} = {top}")
+			case PushA() | PushB() | PushC(): self.push(indent, REGISTERS[op.__class__])
+			case ConstantA(arg=value) | ConstantB(arg=value) | ConstantC(arg=value): self.emit(indent, f"{REGISTERS[op.__class__]} = {value}")
+			case MoveA() | MoveB() | MoveC(): self.emit(indent, f"{REGISTERS[op.__class__]} = {"pop()" if proven else "pop() if data else 0"}")
+			case Arithmetics(arg=code): self.arithmetics(indent, key, offset, code)
+
+			case SaveAlt() if proven:
+				self.emit(indent, "if alt is None: alt = process._alt_data = array(\"q\")")
+				self.emit(indent, "alt.append(pop())")
+
+			case SaveAlt():
+				self.emit(indent, "if data:")
+				self.emit(indent + 1, "if alt is None: alt = process._alt_data = array(\"q\")")
+				self.emit(indent + 1, "alt.append(pop())")
+
+			case LoadAlt():
+				self.emit(indent, "append(alt.pop())" if proven else "if alt: append(alt.pop())")
+
+			case SetAConstantBArithmetics(arg=value, function=code):
+				self.emit(indent, f"a = {top}; b = {value}")
+				self.arithmetics(indent, key, offset, code)
+
+			case ConstantBArithmetics(arg=value, function=code):
+				self.emit(indent, f"b = {value}")
+				self.arithmetics(indent, key, offset, code)
+
+			case DropDataPushA():
+				self.emit(indent, drop)
+				self.push(indent, "a")
+
+			case DropDataPushData(arg=value):
+				self.emit(indent, drop)
+				self.emit(indent, f"append({wrap_word(value)})")
+
+			case Halt(): ...
+
+	def segment(self, indent: int, keys: list[int]):
+		if not keys: return
+		# a segment only starts when the whole of it fits the budget, so compiled code never overshoots a quantum
+		self.emit(indent, f"if n + {len(keys)} > budget:")
+		self.exit(indent + 1, keys[0], "n")
+		for offset, key in enumerate(keys): self.op(indent, key, offset)
+
+		if isinstance(self.ops[keys[-1]], Halt):
+			self.exit(indent, keys[-1] + 1, f"n + {len(keys)}", True)
+
+		else:
+			self.emit(indent, f"n += {len(keys)}")
+
+	def close(self, indent: int, key: int, exit_key: int|None):
+		self.emit(indent, "if n >= budget:")
+		self.exit(indent + 1, key, "n")
+		self.emit(indent, "n += 1")
+		self.emit(indent, "if a == 0:")
+		if exit_key is None: self.emit(indent + 1, "break")
+		else: self.exit(indent + 1, exit_key, "n")
+
+	def body(self, indent: int, key: int, stop: int):
+		keys: list[int] = [ ]
+
+		while key < stop:
+			match self.ops[key]:
+				case ConditionalOpen():
+					self.segment(indent, [ *keys, key ])
+					keys = [ ]
+					close_key = self.jumps[key]
+					self.emit(indent, "if a != 0:")
+					self.emit(indent + 1, "while True:")
+					self.body(indent + 2, key + 1, close_key)
+					self.close(indent + 2, close_key, None)
+					key = close_key + 1
+
+				case Halt():
+					self.segment(indent, [ *keys, key ])
+					keys = [ ]
+					key += 1
+
+				case _:
+					keys.append(key)
+					key += 1
+
+		self.segment(indent, keys)
+
+def is_compilable(ops: tuple[OP, ...], jumps: tuple[int, ...], open_key: int, close_key: int) -> bool:
+	if not (0 <= open_key < close_key < len(ops)) or jumps[open_key] != close_key or jumps[close_key] != open_key:
+		return False
+
+	for key in range(open_key + 1, close_key):
+		match ops[key]:
+			case ConditionalOpen() if not key < jumps[key] < close_key: return False
+			case ConditionalClose() if not open_key < jumps[key] < key: return False
+			case op if not isinstance(op, COMPILED_OPS): return False
+
+	return True
+
+def compile_loop(
+	ops: tuple[OP, ...], jumps: tuple[int, ...], open_key: int, close_key: int, proven: tuple[bool, ...]|None = None
+) -> Block|None:
+	from koseki import STATUS_HALTED, safe_get_function
+
+	if not is_compilable(ops, jumps, open_key, close_key): return None
+	emitter = _Emitter(ops, jumps, STATUS_HALTED, safe_get_function, proven)
+	emitter.emit(0, "def block(process, budget):")
+	emitter.emit(1, "a = process._a; b = process._b; c = process._c")
+	emitter.emit(1, "data = process._data; append = data.append; pop = data.pop")
+	emitter.emit(1, "alt = process._alt_data")
+	emitter.emit(1, "n = 0")
+	emitter.emit(1, "while True:")
+	emitter.body(2, open_key + 1, close_key)
+	emitter.close(2, close_key, close_key + 1)
+
+	namespace = dict(emitter.names)
+	exec(compile("\n".join(emitter.lines), f"<koseki loop {open_key}:{close_key}>", "exec"), namespace)
+	return namespace["block"]
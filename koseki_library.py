@@ -0,0 +1,256 @@
+from __future__ import annotations
+import shlex
+import struct
+import sys
+from argparse import ArgumentParser
+from array import array
+from dataclasses import dataclass, field
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from rich.console import Console
+from rich.table import Table
+
+from koseki import OP_ARITIES, OPCODES, Machine, Words, as_words
+from koseki_intrinsics import INTRINSICS
+from koseki_ops import *
+from koseki_ram import as_page
+
+LIBRARY_MAGIC: bytes = b"KOSEKILB"
+LIBRARY_VERSION: int = 1
+LIBRARY_HEADER: struct.Struct = struct.Struct("<8sIIQQ")
+LIBRARY_ENTRY: struct.Struct = struct.Struct("<qQQQII")
+FLAG_BIG_ENDIAN: int = 1
+ENTRY_ENABLED: int = 1
+
+MNEMONICS: dict[str, type[OP]] = { op_type.__name__: op_type for op_type in OPCODES }
+FUNCTION_CODES: dict[str, int] = { function.name: code for code, function in enumerate(ARITHMETICS) }
+INTRINSIC_CODES: dict[str, int] = { function.name: code for code, function in enumerate(INTRINSICS) }
+
+@dataclass
+class LibraryProgram:
+	name: str
+	key: int
+	words: Words
+	enabled: bool = False
+
+@dataclass
+class ProgramLibrary:
+	programs: dict[str, LibraryProgram]
+	_views: list[memoryview] = field(default_factory=list, repr=False)
+	_mapped: mmap|None = field(default=None, repr=False)
+
+	@property
+	def enabled(self) -> set[int]:
+		return { program.key for program in self.programs.values() if program.enabled }
+
+	def RAMs(self) -> dict[int, Words]:
+		return { program.key: program.words for program in self.programs.values() }
+
+	def install(self, machine: Machine):
+		machine.init_with(self.RAMs(), self.enabled)
+
+	def close(self):
+		# RAMs copy their words out, so the mapping can go once nothing else holds a view into it
+		for program in self.programs.values():
+			if isinstance(program.words, memoryview): program.words.release()
+
+		for view in reversed(self._views): view.release()
+		self._views.clear()
+		if self._mapped is not None: self._mapped.close()
+		self._mapped = None
+
+	def __enter__(self) -> ProgramLibrary:
+		return self
+
+	def __exit__(self, *_):
+		self.close()
+
+def pack_library(programs: Iterable[LibraryProgram]) -> bytes:
+	programs = list(programs)
+	names: list[bytes] = [ program.name.encode() for program in programs ]
+	if len(set(names)) != len(names): raise ValueError("duplicate program names")
+	if len({ program.key for program in programs }) != len(programs): raise ValueError("duplicate program keys")
+
+	pages: list[array] = [ as_page(as_words(program.words)) for program in programs ]
+	index = bytearray()
+	name_offset: int = 0
+	word_offset: int = 0
+
+	for program, name, page in zip(programs, names, pages):
+		flags = ENTRY_ENABLED if program.enabled else 0
+		index += LIBRARY_ENTRY.pack(program.key, flags, word_offset, len(page), name_offset, len(name))
+		name_offset += len(name)
+		word_offset += len(page)
+
+	blob = b"".join(names)
+	flags = FLAG_BIG_ENDIAN if sys.byteorder == "big" else 0
+	header = LIBRARY_HEADER.pack(LIBRARY_MAGIC, LIBRARY_VERSION, flags, len(programs), len(blob))
+	return b"".join((header, index, blob, bytes(-len(blob)%8), *(page.tobytes() for page in pages)))
+
+def read_library(buffer: bytes|bytearray|memoryview|mmap) -> ProgramLibrary:
+	if len(buffer) < LIBRARY_HEADER.size: raise ValueError("not a koseki program library")
+	magic, version, flags, count, names_size = LIBRARY_HEADER.unpack_from(buffer)
+	if magic != LIBRARY_MAGIC: raise ValueError("not a koseki program library")
+	if version != LIBRARY_VERSION: raise ValueError(f"unsupported library version {version}")
+
+	if bool(flags & FLAG_BIG_ENDIAN) != (sys.byteorder == "big"):
+		raise ValueError("library was written with a different byte order")
+
+	names_start = LIBRARY_HEADER.size + count*LIBRARY_ENTRY.size
+	words_start = names_start + names_size + -names_size%8
+	if words_start > len(buffer) or (len(buffer) - words_start)%8: raise ValueError("truncated program library")
+	word_count = (len(buffer) - words_start)//8
+	names = bytes(buffer[names_start:names_start + names_size])
+	entries = list(LIBRARY_ENTRY.iter_unpack(bytes(buffer[LIBRARY_HEADER.size:names_start])))
+
+	for key, entry_flags, offset, size, name_offset, name_size in entries:
+		if offset + size > word_count or name_offset + name_size > names_size: raise ValueError("corrupt program library")
+
+	# views are only taken once the index checks out, so a bad file never leaves the buffer exported
+	view = memoryview(buffer)
+	words = view[words_start:].cast("q")
+	programs: dict[str, LibraryProgram] = { }
+
+	for key, entry_flags, offset, size, name_offset, name_size in entries:
+		name = names[name_offset:name_offset + name_size].decode(errors="replace")
+		programs[name] = LibraryProgram(name, key, words[offset:offset + size], bool(entry_flags & ENTRY_ENABLED))
+
+	return ProgramLibrary(programs, [ view, words ])
+
+def save_library(programs: Iterable[LibraryProgram], path: str|Path):
+	Path(path).write_bytes(pack_library(programs))
+
+def load_library(path: str|Path) -> ProgramLibrary:
+	with open(path, "rb") as file:
+		mapped = mmap(file.fileno(), 0, access=ACCESS_READ)
+
+	try: library = read_library(mapped)
+	except ValueError:
+		mapped.close()
+		raise
+
+	library._mapped = mapped
+	return library
+
+def _parse_arg(op_type: type[OP], token: str) -> int:
+	try: return int(token, 0)
+	except ValueError: ...
+
+	codes = FUNCTION_CODES if op_type is Arithmetics else INTRINSIC_CODES if op_type is Intrinsic else { }
+	if token in codes: return codes[token]
+	raise ValueError(f"bad argument {token!r} for {op_type.__name__}")
+
+def assemble(source: str) -> list[LibraryProgram]:
+	programs: list[LibraryProgram] = [ ]
+	words: list[int] = [ ]
+
+	for number, line in enumerate(source.splitlines(), 1):
+		try:
+			match shlex.split(line, comments=True):
+				case [ ]:
+					continue
+
+				case [ ".program", name, key, *enabled ] if enabled in ([ ], [ "enabled" ]):
+					words = [ ]
+					programs.append(LibraryProgram(name, int(key, 0), words, bool(enabled)))
+
+				case _ if not programs:
+					raise ValueError("code before the first .program")
+
+				case [ ".word", *values ]:
+					words.extend(int(value, 0) for value in values)
+
+				case [ mnemonic, *args ] if mnemonic in MNEMONICS:
+					op_type = MNEMONICS[mnemonic]
+					opcode, arity = OPCODES[op_type]
+					if len(args) > arity: raise ValueError(f"{mnemonic} takes {arity} argument(s)")
+					words.append(opcode)
+					if arity == 1: words.append(_parse_arg(op_type, args[0]) if args else 0)
+
+				case [ word, *_ ]:
+					raise ValueError(f"unknown op {word!r}")
+
+		except ValueError as error:
+			raise ValueError(f"line {number}: {error}") from None
+
+	return programs
+
+def _format_arg(op_type: type[OP], value: int) -> str:
+	names = ARITHMETICS if op_type is Arithmetics else INTRINSICS if op_type is Intrinsic else ()
+	return shlex.quote(names[value].name) if 0 <= value < len(names) else str(value)
+
+def iter_disassembly(words: Words) -> Iterator[str]:
+	words = as_words(words)
+	size = len(words)
+	key: int = 0
+
+	# anything the loader would skip or pad stays as raw words, so the text assembles back to the same image
+	while key < size:
+		opcode = words[key]
+		arity = OP_ARITIES[opcode] if 0 <= opcode < len(OPS) else None
+
+		if arity == 0:
+			yield OPS[opcode].__name__
+			key += 1
+
+		elif arity == 1 and key + 1 < size:
+			yield f"{OPS[opcode].__name__} {_format_arg(OPS[opcode], words[key + 1])}"
+			key += 2
+
+		else:
+			yield f".word {opcode}"
+			key += 1
+
+def disassemble(programs: Iterable[LibraryProgram]) -> str:
+	lines: list[str] = [ ]
+
+	for program in programs:
+		lines.append(f".program {shlex.quote(program.name)} {program.key}{" enabled" if program.enabled else ""}")
+		lines.extend(f"\t{line}" for line in iter_disassembly(program.words))
+		lines.append("")
+
+	return "\n".join(lines)
+
+def main() -> int:
+	parser = ArgumentParser(description="assemble, disassemble and list Koseki program libraries")
+	commands = parser.add_subparsers(dest="command", required=True)
+	assemble_parser = commands.add_parser("assemble", help="build a library from assembly text")
+	assemble_parser.add_argument("source", type=Path)
+	assemble_parser.add_argument("output", type=Path)
+	disassemble_parser = commands.add_parser("disassemble", help="print a library as assembly text")
+	disassemble_parser.add_argument("library", type=Path)
+	list_parser = commands.add_parser("list", help="list the programs in a library")
+	list_parser.add_argument("library", type=Path)
+	arguments = parser.parse_args()
+	console = Console()
+
+	try:
+		match arguments.command:
+			case "assemble":
+				programs = assemble(arguments.source.read_text())
+				save_library(programs, arguments.output)
+				console.print(f"assembled {len(programs)} programs into {arguments.output}")
+
+			case "disassemble":
+				with load_library(arguments.library) as library:
+					sys.stdout.write(disassemble(library.programs.values()))
+
+			case "list":
+				table = Table("name", "key", "words", "enabled", title=str(arguments.library))
+
+				with load_library(arguments.library) as library:
+					for program in library.programs.values():
+						table.add_row(program.name, str(program.key), f"{len(program.words):,}", "yes" if program.enabled else "")
+
+				console.print(table)
+
+	except ValueError as error:
+		console.print(f"[red]error[/red] {error}")
+		return 1
+
+	return 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
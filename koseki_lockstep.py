@@ -0,0 +1,412 @@
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Callable, Sequence
+import numpy as np
+
+from koseki import Machine, Process, STATUS_HALTED, STATUS_RUNNING, safe_get_function
+from koseki_ops import *
+from koseki_ram import WORD_MIN, WORD_MAX, wrap_word
+
+EXACT_FLOAT: float = 2.0**53
+
+type Lanes = np.ndarray
+type VectorFunction = Callable[[np.ndarray, np.ndarray, np.ndarray], tuple[np.ndarray, np.ndarray]]
+
+class Kind(IntEnum):
+	SCALAR = 0
+	NO_OP = 1
+	PUSH_DATA = 2
+	DROP_DATA = 3
+	CONDITIONAL_OPEN = 4
+	CONDITIONAL_CLOSE = 5
+	ARITHMETICS = 6
+	SAVE_ALT = 7
+	LOAD_ALT = 8
+	HALT = 9
+	SET_A = 10
+	SET_B = 11
+	SET_C = 12
+	PUSH_A = 13
+	PUSH_B = 14
+	PUSH_C = 15
+	CONSTANT_A = 16
+	CONSTANT_B = 17
+	CONSTANT_C = 18
+	MOVE_A = 19
+	MOVE_B = 20
+	MOVE_C = 21
+	SET_A_CONSTANT_B_ARITHMETICS = 22
+	CONSTANT_B_ARITHMETICS = 23
+	DROP_DATA_PUSH_A = 24
+	DROP_DATA_PUSH_DATA = 25
+
+REGISTER_KINDS: dict[type[OP], Kind] = {
+	SetA: Kind.SET_A, SetB: Kind.SET_B, SetC: Kind.SET_C,
+	PushA: Kind.PUSH_A, PushB: Kind.PUSH_B, PushC: Kind.PUSH_C,
+	ConstantA: Kind.CONSTANT_A, ConstantB: Kind.CONSTANT_B, ConstantC: Kind.CONSTANT_C,
+	MoveA: Kind.MOVE_A, MoveB: Kind.MOVE_B, MoveC: Kind.MOVE_C
+}
+
+NULLARY_KINDS: dict[type[OP], Kind] = {
+	NoOP: Kind.NO_OP, DropData: Kind.DROP_DATA,
+	ConditionalOpen: Kind.CONDITIONAL_OPEN, ConditionalClose: Kind.CONDITIONAL_CLOSE,
+	SaveAlt: Kind.SAVE_ALT, LoadAlt: Kind.LOAD_ALT, Halt: Kind.HALT,
+	DropDataPushA: Kind.DROP_DATA_PUSH_A
+}
+
+def _never(a: np.ndarray) -> np.ndarray:
+	return np.zeros(a.shape, dtype=bool)
+
+def _add(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+	result = a + b
+	return result, ((a ^ result) & (b ^ result)) < 0
+
+def _subtract(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+	result = a - b
+	return result, ((a ^ b) & (a ^ result)) < 0
+
+def _multiply(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+	return a*b, np.abs(a.astype(np.float64))*np.abs(b.astype(np.float64)) >= 2.0**62
+
+def _divide(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+	# int(a/b) divides as floats, which numpy reproduces while both operands are exact doubles
+	zero = b == 0
+	quotient = np.trunc(a/np.where(zero, 1, b))
+	unsafe = (np.abs(a.astype(np.float64)) > EXACT_FLOAT) | (np.abs(b.astype(np.float64)) > EXACT_FLOAT)
+	return np.where(zero, 999, np.where(unsafe, 0, quotient).astype(np.int64)), unsafe & ~zero
+
+def _modulo(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+	unsafe = (b == 0) | ((a == WORD_MIN) & (b == -1))
+	return np.remainder(a, np.where(unsafe, 1, b)), unsafe
+
+def _compare(compare: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> VectorFunction:
+	return lambda a, b, c: (compare(a, b).astype(np.int64), _never(a))
+
+VECTOR_FUNCTIONS: dict[str, VectorFunction] = {
+	"Identity": lambda a, b, c: (a, _never(a)),
+	"Addition": _add,
+	"Multiplication": _multiply,
+	"Substraction": _subtract,
+	"Division": _divide,
+	"Modulo": _modulo,
+	"Constant true": lambda a, b, c: (np.full(a.shape, true, dtype=np.int64), _never(a)),
+	">": _compare(np.greater),
+	">=": _compare(np.greater_equal),
+	"<": _compare(np.less),
+	"<=": _compare(np.less_equal),
+	"==": _compare(np.equal),
+	"!=": _compare(np.not_equal)
+}
+
+VECTOR_FUNCTION_NAMES: tuple[str, ...] = tuple(VECTOR_FUNCTIONS)
+VECTOR_FUNCTION_TABLE: tuple[VectorFunction, ...] = tuple(VECTOR_FUNCTIONS.values())
+
+def is_word(value: int) -> bool:
+	return WORD_MIN <= value <= WORD_MAX
+
+@dataclass
+class LockstepProgram:
+	ops: tuple[OP, ...]
+	kinds: np.ndarray
+	args: np.ndarray
+	functions: np.ndarray
+	jumps: np.ndarray
+
+	@staticmethod
+	def new(ops: tuple[OP, ...], jumps: tuple[int, ...]) -> LockstepProgram:
+		kinds = np.full(len(ops), Kind.SCALAR, dtype=np.int64)
+		args = np.zeros(len(ops), dtype=np.int64)
+		functions = np.zeros(len(ops), dtype=np.int64)
+
+		for key, op in enumerate(ops):
+			function = VECTOR_FUNCTION_NAMES.index(name) if (name := _function_name(op)) in VECTOR_FUNCTIONS else None
+
+			match op:
+				case PushData(arg=value) | DropDataPushData(arg=value):
+					kinds[key] = Kind.PUSH_DATA if isinstance(op, PushData) else Kind.DROP_DATA_PUSH_DATA
+					args[key] = wrap_word(value)
+
+				case ConstantA(arg=value) | ConstantB(arg=value) | ConstantC(arg=value) if is_word(value):
+					kinds[key] = REGISTER_KINDS[op.__class__]
+					args[key] = value
+
+				case ConstantA() | ConstantB() | ConstantC(): ...
+
+				case Arithmetics() if function is not None:
+					kinds[key] = Kind.ARITHMETICS
+					functions[key] = function
+
+				case SetAConstantBArithmetics(arg=value) | ConstantBArithmetics(arg=value) if function is not None and is_word(value):
+					kinds[key] = Kind.SET_A_CONSTANT_B_ARITHMETICS if isinstance(op, SetAConstantBArithmetics) else Kind.CONSTANT_B_ARITHMETICS
+					args[key] = value
+					functions[key] = function
+
+				case _ if op.__class__ in REGISTER_KINDS:
+					kinds[key] = REGISTER_KINDS[op.__class__]
+
+				case _ if op.__class__ in NULLARY_KINDS:
+					kinds[key] = NULLARY_KINDS[op.__class__]
+
+		return LockstepProgram(ops, kinds, args, functions, np.array(jumps, dtype=np.int64))
+
+def _function_name(op: OP) -> str|None:
+	match op:
+		case Arithmetics(arg=code): return safe_get_function(code, ARITHMETICS).name
+		case SetAConstantBArithmetics(function=code) | ConstantBArithmetics(function=code): return safe_get_function(code, ARITHMETICS).name
+		case _: return None
+
+@dataclass
+class LockstepResult:
+	processes: list[Process]
+	machines: dict[int, Machine] = field(default_factory=dict)
+	errors: dict[int, str] = field(default_factory=dict)
+	ticks: int = 0
+
+class Lockstep:
+	def __init__(self, program: LockstepProgram, processes: Sequence[Process], stack_capacity: int):
+		count = len(processes)
+		self.program = program
+		self.processes = list(processes)
+		self.capacity = max(stack_capacity, 1)
+		self.registers = np.zeros((3, count), dtype=np.int64)
+		self.head = np.zeros(count, dtype=np.int64)
+		self.status = np.full(count, STATUS_RUNNING, dtype=np.int64)
+		self.data = np.zeros((count, self.capacity), dtype=np.int64)
+		self.depth = np.zeros(count, dtype=np.int64)
+		self.alt = np.zeros((count, self.capacity), dtype=np.int64)
+		self.alt_depth = np.zeros(count, dtype=np.int64)
+		self.has_alt = np.zeros(count, dtype=bool)
+		self.steps = np.zeros(count, dtype=np.int64)
+		self.stalled = np.zeros(count, dtype=bool)
+		self.scalar: list[int] = [ ]
+		live: list[int] = [ ]
+
+		for lane, process in enumerate(self.processes):
+			if self._load(lane, process): live.append(lane)
+			else: self.scalar.append(lane)
+
+		self.live: Lanes = np.array(live, dtype=np.int64)
+
+	def _load(self, lane: int, process: Process) -> bool:
+		if (
+			process._status != STATUS_RUNNING or not 0 <= process._head < len(self.program.ops)
+			or len(process._data) > self.capacity
+			or (process._alt_data is not None and len(process._alt_data) > self.capacity)
+			or not all(is_word(register) for register in (process._a, process._b, process._c))
+		):
+			return False
+
+		self.registers[:, lane] = (process._a, process._b, process._c)
+		self.head[lane] = process._head
+		self.depth[lane] = len(process._data)
+		self.data[lane, :len(process._data)] = process._data
+
+		if process._alt_data is not None:
+			self.has_alt[lane] = True
+			self.alt_depth[lane] = len(process._alt_data)
+			self.alt[lane, :len(process._alt_data)] = process._alt_data
+
+		return True
+
+	def store(self, lane: int):
+		process = self.processes[lane]
+		process._a, process._b, process._c = (int(register) for register in self.registers[:, lane])
+		process._head = int(self.head[lane])
+		process._status = int(self.status[lane])
+		del process._data[:]
+		process._data.frombytes(self.data[lane, :self.depth[lane]].tobytes())
+
+		if self.has_alt[lane]:
+			if process._alt_data is None: process._alt_data = array("q")
+			del process._alt_data[:]
+			process._alt_data.frombytes(self.alt[lane, :self.alt_depth[lane]].tobytes())
+
+	def run(self, steps: int, min_lanes: int) -> int:
+		program = self.program
+		size = len(program.ops)
+		ticks: int = 0
+
+		while self.live.size and ticks < steps:
+			if self.live.size < min_lanes:
+				# a handful of lanes runs faster on the scalar interpreter than through numpy dispatch
+				self._stall(self.live)
+				self.live = self.live[:0]
+				break
+
+			ticks += 1
+			live = self.live
+			kinds = program.kinds[self.head[live]]
+
+			for kind in np.flatnonzero(np.bincount(kinds, minlength=len(Kind))):
+				self._execute(Kind(kind), live[kinds == kind])
+
+			executed = live[~self.stalled[live]]
+			self.head[executed] += 1
+			self.steps[executed] += 1
+			halted = (self.head[executed] >= size) | (self.status[executed] == STATUS_HALTED)
+			self.status[executed[halted]] = STATUS_HALTED
+			self.live = executed[~halted]
+
+		return ticks
+
+	def _stall(self, lanes: Lanes):
+		if lanes.size:
+			self.stalled[lanes] = True
+			self.scalar.extend(lanes.tolist())
+
+	def _top(self, lanes: Lanes) -> np.ndarray:
+		depth = self.depth[lanes]
+		return np.where(depth > 0, self.data[lanes, np.maximum(depth - 1, 0)], 0)
+
+	def _pop(self, lanes: Lanes) -> np.ndarray:
+		top = self._top(lanes)
+		self.depth[lanes] = np.maximum(self.depth[lanes] - 1, 0)
+		return top
+
+	def _push(self, lanes: Lanes, values: np.ndarray):
+		depth = self.depth[lanes]
+		self.data[lanes, depth] = values
+		self.depth[lanes] = depth + 1
+
+	def _room(self, lanes: Lanes) -> Lanes:
+		full = self.depth[lanes] >= self.capacity
+		self._stall(lanes[full])
+		return lanes[~full]
+
+	def _apply(self, lanes: Lanes, a: np.ndarray, b: np.ndarray) -> tuple[Lanes, np.ndarray]:
+		functions = self.program.functions[self.head[lanes]]
+		c = self.registers[2, lanes]
+
+		if not lanes.size or (functions == functions[0]).all():
+			results, unsafe = VECTOR_FUNCTION_TABLE[functions[0] if lanes.size else 0](a, b, c)
+			self._stall(lanes[unsafe])
+			return lanes[~unsafe], results[~unsafe]
+
+		results = np.zeros(lanes.size, dtype=np.int64)
+		unsafe = np.zeros(lanes.size, dtype=bool)
+
+		for function in np.unique(functions):
+			chosen = functions == function
+			results[chosen], unsafe[chosen] = VECTOR_FUNCTION_TABLE[function](a[chosen], b[chosen], c[chosen])
+
+		self._stall(lanes[unsafe])
+		return lanes[~unsafe], results[~unsafe]
+
+	def _execute(self, kind: Kind, lanes: Lanes):
+		program = self.program
+
+		match kind:
+			case Kind.NO_OP: ...
+
+			case Kind.PUSH_DATA:
+				lanes = self._room(lanes)
+				self._push(lanes, program.args[self.head[lanes]])
+
+			case Kind.DROP_DATA:
+				self.depth[lanes] = np.maximum(self.depth[lanes] - 1, 0)
+
+			case Kind.CONDITIONAL_OPEN:
+				jumping = lanes[self.registers[0, lanes] == 0]
+				self.head[jumping] = program.jumps[self.head[jumping]]
+
+			case Kind.CONDITIONAL_CLOSE:
+				jumping = lanes[self.registers[0, lanes] != 0]
+				self.head[jumping] = program.jumps[self.head[jumping]]
+
+			case Kind.ARITHMETICS:
+				lanes, results = self._apply(lanes, self.registers[0, lanes], self.registers[1, lanes])
+				self.registers[0, lanes] = results
+
+			case Kind.SAVE_ALT:
+				lanes = lanes[self.depth[lanes] > 0]
+				full = self.alt_depth[lanes] >= self.capacity
+				self._stall(lanes[full])
+				lanes = lanes[~full]
+				self.alt[lanes, self.alt_depth[lanes]] = self._pop(lanes)
+				self.alt_depth[lanes] += 1
+				self.has_alt[lanes] = True
+
+			case Kind.LOAD_ALT:
+				lanes = self._room(lanes[self.alt_depth[lanes] > 0])
+				self.alt_depth[lanes] -= 1
+				self._push(lanes, self.alt[lanes, self.alt_depth[lanes]])
+
+			case Kind.HALT:
+				self.status[lanes] = STATUS_HALTED
+
+			case Kind.SET_A | Kind.SET_B | Kind.SET_C:
+				self.registers[kind - Kind.SET_A, lanes] = self._top(lanes)
+
+			case Kind.PUSH_A | Kind.PUSH_B | Kind.PUSH_C:
+				lanes = self._room(lanes)
+				self._push(lanes, self.registers[kind - Kind.PUSH_A, lanes])
+
+			case Kind.CONSTANT_A | Kind.CONSTANT_B | Kind.CONSTANT_C:
+				self.registers[kind - Kind.CONSTANT_A, lanes] = program.args[self.head[lanes]]
+
+			case Kind.MOVE_A | Kind.MOVE_B | Kind.MOVE_C:
+				self.registers[kind - Kind.MOVE_A, lanes] = self._pop(lanes)
+
+			case Kind.SET_A_CONSTANT_B_ARITHMETICS:
+				values = program.args[self.head[lanes]]
+				lanes, results = self._apply(lanes, self._top(lanes), values)
+				self.registers[1, lanes] = program.args[self.head[lanes]]
+				self.registers[0, lanes] = results
+
+			case Kind.CONSTANT_B_ARITHMETICS:
+				values = program.args[self.head[lanes]]
+				lanes, results = self._apply(lanes, self.registers[0, lanes], values)
+				self.registers[1, lanes] = program.args[self.head[lanes]]
+				self.registers[0, lanes] = results
+
+			case Kind.DROP_DATA_PUSH_A:
+				self._pop(lanes)
+				self._push(lanes, self.registers[0, lanes])
+
+			case Kind.DROP_DATA_PUSH_DATA:
+				self._pop(lanes)
+				self._push(lanes, program.args[self.head[lanes]])
+
+			case _:
+				self._stall(lanes)
+
+def _catch_up(machine: Machine, tick: int):
+	# vector steps only touch the lane itself, so the machine's own processes advance as if it weren't there
+	while machine.tick < tick and not machine.is_idle: machine.run_step()
+	machine._tick = max(machine.tick, tick)
+
+def run_lockstep(
+	processes: Sequence[Process], steps: int, machine_factory: Callable[[], Machine] = Machine.new,
+	key: int = 1, stack_capacity: int = 64, min_lanes: int = 16
+) -> LockstepResult:
+	result = LockstepResult(list(processes))
+	if not result.processes: return result
+	first = result.processes[0]
+
+	if any(process._ops != first._ops for process in result.processes):
+		raise ValueError("lockstep processes must run the same ops")
+
+	if len({ id(process._data) for process in result.processes }) < len(result.processes):
+		raise ValueError("lockstep processes must not share data stacks")
+
+	lockstep = Lockstep(LockstepProgram.new(first._ops, first._jumps), result.processes, stack_capacity)
+	result.ticks = lockstep.run(steps, min_lanes)
+	for lane in lockstep.live.tolist(): lockstep.store(lane)
+
+	for lane in lockstep.scalar:
+		done = int(lockstep.steps[lane])
+		if lockstep.stalled[lane]: lockstep.store(lane)
+		machine = machine_factory()
+		_catch_up(machine, done)
+		machine.spawn_process(result.processes[lane], key)
+		result.machines[lane] = machine
+
+		try: machine.run(steps - done)
+		except Exception as exception: result.errors[lane] = f"{exception.__class__.__name__}: {exception}"
+
+	for lane in np.flatnonzero(lockstep.status == STATUS_HALTED).tolist():
+		if lane not in result.machines: lockstep.store(lane)
+
+	return result
@@ -25,6 +25,7 @@ class LoadAlt(OP): ...
 class Halt(OP): ...
 class Call(OP): ...
 class Sleep(OP): ...
+class Intrinsic(OP): ...
 
 class SendSignal(OP): ...
 class PullSignal(OP): ...
@@ -63,7 +64,24 @@ OPS: tuple[type[OP], ...] = (
 	ReadRAM, WriteRAM, CloneRAM, DropRAM,
 	SetA, SetB, SetC, PushA, PushB, PushC,
 	ConstantA, ConstantB, ConstantC,
-	MoveA, MoveB, MoveC
+	MoveA, MoveB, MoveC,
+	Intrinsic
+)
+
+@dataclass
+class SetAConstantBArithmetics(OP):
+	function: int = 0
+
+@dataclass
+class ConstantBArithmetics(OP):
+	function: int = 0
+
+class DropDataPushA(OP): ...
+class DropDataPushData(OP): ...
+
+SUPERINSTRUCTIONS: tuple[type[OP], ...] = (
+	SetAConstantBArithmetics, ConstantBArithmetics,
+	DropDataPushA, DropDataPushData
 )
 
 @dataclass
@@ -87,7 +105,8 @@ ARITHMETICS: Library = (
 	Function(lambda a, b, c: int(a < b), "<"),
 	Function(lambda a, b, c: int(a <= b), "<="),
 	Function(lambda a, b, c: int(a == b), "=="),
-	Function(lambda a, b, c: int(a != b), "!=")
+	Function(lambda a, b, c: int(a != b), "!="),
+	Function(lambda a, b, c: pow(a, b, c) if b >= 0 and c != 0 else 0, "Modular pow")
 )
 
 def get_function(name: str, library: Library = ARITHMETICS) -> int:
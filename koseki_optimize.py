@@ -0,0 +1,183 @@
+from koseki_ops import *
+from koseki_ram import wrap_word
+
+REGISTERS: dict[type[OP], str] = {
+	SetA: "a", SetB: "b", SetC: "c",
+	PushA: "a", PushB: "b", PushC: "c",
+	ConstantA: "a", ConstantB: "b", ConstantC: "c",
+	MoveA: "a", MoveB: "b", MoveC: "c"
+}
+
+CONSTANTS: dict[str, type[OP]] = { "a": ConstantA, "b": ConstantB, "c": ConstantC }
+
+PURE_OPS: tuple[type[OP], ...] = (
+	NoOP, PushData, DropData, SaveAlt, LoadAlt, Arithmetics,
+	SetA, SetB, SetC, PushA, PushB, PushC,
+	ConstantA, ConstantB, ConstantC,
+	MoveA, MoveB, MoveC
+)
+
+def _fold_constants(ops: list[OP]) -> list[OP]:
+	known: dict[str, int] = { }
+	folded: list[OP] = [ ]
+
+	for op in ops:
+		match op:
+			case NoOP():
+				continue
+
+			case ConstantA(arg=value) | ConstantB(arg=value) | ConstantC(arg=value):
+				register = REGISTERS[op.__class__]
+				if known.get(register) == value: continue
+				known[register] = value
+
+			case SetA() | SetB() | SetC() | MoveA() | MoveB() | MoveC():
+				known.pop(REGISTERS[op.__class__], None)
+
+			case PushA() | PushB() | PushC():
+				register = REGISTERS[op.__class__]
+				if register in known: op = PushData(known[register])
+
+			case Arithmetics(arg=code):
+				if "a" in known and "b" in known and "c" in known:
+					function = ARITHMETICS[code] if 0 <= code < len(ARITHMETICS) else ARITHMETICS[0]
+
+					try:
+						value = function.callback(known["a"], known["b"], known["c"])
+
+					except ArithmeticError:
+						known.pop("a")
+
+					else:
+						if known["a"] == value: continue
+						known["a"] = value
+						op = ConstantA(value)
+
+				else:
+					known.pop("a", None)
+
+		folded.append(op)
+
+	return folded
+
+def _combine_pairs(ops: list[OP]) -> list[OP]:
+	combined: list[OP] = [ ]
+	key: int = 0
+
+	while key < len(ops):
+		op = ops[key]
+		following = ops[key + 1] if key + 1 < len(ops) else NoOP()
+
+		match op, following:
+			# the data stack holds int64 words, so a value only survives the round trip wrapped;
+			# a register pushed and read back is left alone since its value may not fit a word
+			case PushData(arg=value), MoveA() | MoveB() | MoveC():
+				combined.append(CONSTANTS[REGISTERS[following.__class__]](wrap_word(value)))
+				key += 2
+				continue
+
+			case PushData() | PushA() | PushB() | PushC(), DropData():
+				key += 2
+				continue
+
+		combined.append(op)
+		key += 1
+
+	return combined
+
+def _drop_dead_writes(ops: list[OP]) -> list[OP]:
+	live: set[str] = { "a", "b", "c" }
+	kept: list[OP] = [ ]
+
+	for op in reversed(ops):
+		match op:
+			case SetA() | SetB() | SetC() | ConstantA() | ConstantB() | ConstantC():
+				register = REGISTERS[op.__class__]
+				if register not in live: continue
+				live.discard(register)
+
+			case MoveA() | MoveB() | MoveC():
+				register = REGISTERS[op.__class__]
+				if register not in live: op = DropData()
+				live.discard(register)
+
+			case PushA() | PushB() | PushC():
+				live.add(REGISTERS[op.__class__])
+
+			case Arithmetics():
+				live.update(("a", "b", "c"))
+
+		kept.append(op)
+
+	kept.reverse()
+	return kept
+
+def _fuse(ops: list[OP]) -> list[OP]:
+	fused: list[OP] = [ ]
+	key: int = 0
+
+	while key < len(ops):
+		match ops[key:key + 3]:
+			case [ SetA(), ConstantB(arg=value), Arithmetics(arg=code) ]:
+				fused.append(SetAConstantBArithmetics(value, code))
+				key += 3
+
+			case [ ConstantB(arg=value), Arithmetics(arg=code), *_ ]:
+				fused.append(ConstantBArithmetics(value, code))
+				key += 2
+
+			case [ DropData(), PushA(), *_ ]:
+				fused.append(DropDataPushA())
+				key += 2
+
+			case [ DropData(), PushData(arg=value), *_ ]:
+				fused.append(DropDataPushData(value))
+				key += 2
+
+			case [ op, *_ ]:
+				fused.append(op)
+				key += 1
+
+	return fused
+
+def _optimize_run(ops: list[OP]) -> list[OP]:
+	while True:
+		optimized = _drop_dead_writes(_combine_pairs(_fold_constants(ops)))
+		if optimized == ops: break
+		ops = optimized
+
+	return _fuse(ops)
+
+def _has_unmatched_close(ops: tuple[OP, ...]) -> bool:
+	level: int = 0
+
+	for op in ops:
+		match op:
+			case ConditionalOpen(): level += 1
+			case ConditionalClose():
+				if level == 0: return True
+				level -= 1
+
+	return False
+
+def optimize_OPs(ops: tuple[OP, ...]) -> tuple[OP, ...]:
+	optimized: list[OP] = [ ]
+	run: list[OP] = [ ]
+	start: int = 0
+
+	# an unmatched ConditionalClose resumes execution at index 1, so op 0 must stay in place
+	if ops and _has_unmatched_close(ops):
+		optimized.append(ops[0])
+		start = 1
+
+	for op in ops[start:]:
+		if isinstance(op, PURE_OPS):
+			run.append(op)
+			continue
+
+		optimized.extend(_optimize_run(run))
+		optimized.append(op)
+		run = [ ]
+
+	optimized.extend(_optimize_run(run))
+	return tuple(optimized)
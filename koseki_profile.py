@@ -0,0 +1,135 @@
+from __future__ import annotations
+import json
+from dataclasses import dataclass, field
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, Callable
+
+from koseki_ops import *
+
+if TYPE_CHECKING:
+	from koseki import Machine, Process
+
+type Step = Callable[[Machine, int], None]
+
+@dataclass
+class OPTiming:
+	samples: int = 0
+	total_ns: int = 0
+
+	@property
+	def mean_ns(self) -> float:
+		return self.total_ns/self.samples if self.samples else 0.0
+
+@dataclass
+class Profiler:
+	sample_rate: int = 64
+	processes: set[int]|None = None
+	instructions: dict[str, int] = field(default_factory=dict)
+	steps: dict[int, int] = field(default_factory=dict)
+	calls: int = 0
+	spawns: int = 0
+	RAM_reads: dict[int, int] = field(default_factory=dict)
+	RAM_writes: dict[int, int] = field(default_factory=dict)
+	timings: dict[str, OPTiming] = field(default_factory=dict)
+	stacks: dict[tuple[str, str], int] = field(default_factory=dict)
+	_countdown: int = field(default=0, repr=False)
+	_frames: dict[int, tuple[Process, str]] = field(default_factory=dict, repr=False)
+
+	def _get_frames(self, machine: Machine, process_key: int, process: Process) -> str:
+		entry = self._frames.get(process_key)
+		if entry is not None and entry[0] is process: return entry[1]
+		frames = f"process {process_key}"
+		seen: set[int] = { process_key }
+		parent_key = process._parent_process
+
+		while parent_key is not None and parent_key not in seen and parent_key in machine._processes:
+			frames = f"process {parent_key};{frames}"
+			seen.add(parent_key)
+			parent_key = machine._processes[parent_key]._parent_process
+
+		self._frames[process_key] = (process, frames)
+		return frames
+
+	def run_step(self, process: Process, step: Step, machine: Machine, process_key: int):
+		head = max(process._head, 0)
+
+		if head >= len(process._ops) or (self.processes is not None and process_key not in self.processes):
+			step(machine, process_key)
+			return
+
+		op = process._ops[head]
+		name = op.__class__.__name__
+		self.instructions[name] = self.instructions.get(name, 0) + 1
+		self.steps[process_key] = self.steps.get(process_key, 0) + 1
+		stack = (self._get_frames(machine, process_key, process), name)
+		self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+		match op:
+			case Call(): self.calls += 1
+			case SpawnProcess(): self.spawns += 1
+
+			case ReadRAM():
+				key = machine._safe_get_RAM_key(process._a)
+				self.RAM_reads[key] = self.RAM_reads.get(key, 0) + 1
+
+			case WriteRAM():
+				key = machine._safe_get_RAM_key(process._a)
+				if process._b >= 0: self.RAM_writes[key] = self.RAM_writes.get(key, 0) + 1
+
+			case CloneRAM():
+				key = machine._safe_get_RAM_key(process._a)
+				self.RAM_reads[key] = self.RAM_reads.get(key, 0) + 1
+				self.RAM_writes[process._b] = self.RAM_writes.get(process._b, 0) + 1
+
+		self._countdown -= 1
+
+		if self.sample_rate <= 0 or self._countdown > 0:
+			step(machine, process_key)
+			return
+
+		self._countdown = self.sample_rate
+		start = perf_counter_ns()
+		step(machine, process_key)
+		elapsed = perf_counter_ns() - start
+		timing = self.timings.get(name)
+		if timing is None: timing = self.timings[name] = OPTiming()
+		timing.samples += 1
+		timing.total_ns += elapsed
+
+	def reset(self):
+		self.instructions.clear()
+		self.steps.clear()
+		self.calls = 0
+		self.spawns = 0
+		self.RAM_reads.clear()
+		self.RAM_writes.clear()
+		self.timings.clear()
+		self.stacks.clear()
+		self._countdown = 0
+		self._frames.clear()
+
+	def as_dict(self) -> dict[str, Any]:
+		def by_count(counts: dict) -> dict:
+			return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+		return {
+			"instructions": by_count(self.instructions),
+			"steps": by_count(self.steps),
+			"calls": self.calls,
+			"spawns": self.spawns,
+			"RAM_reads": by_count(self.RAM_reads),
+			"RAM_writes": by_count(self.RAM_writes),
+			"timings": {
+				name: { "samples": timing.samples, "total_ns": timing.total_ns, "mean_ns": timing.mean_ns }
+				for name, timing in sorted(self.timings.items(), key=lambda item: -item[1].total_ns)
+			}
+		}
+
+	def to_json(self, indent: int|None = None) -> str:
+		return json.dumps(self.as_dict(), indent=indent)
+
+	def collapsed_stacks(self) -> str:
+		return "\n".join(
+			f"{frames};{name} {count}"
+			for (frames, name), count in sorted(self.stacks.items())
+		)
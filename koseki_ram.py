@@ -0,0 +1,355 @@
+from __future__ import annotations
+from array import array
+from itertools import chain
+from typing import Iterable, Iterator
+
+PAGE_BITS: int = 9
+PAGE_SIZE: int = 1 << PAGE_BITS
+PAGE_MASK: int = PAGE_SIZE - 1
+
+WORD_MIN: int = -2**63
+WORD_MAX: int = 2**63 - 1
+WORD_MASK: int = 2**64 - 1
+
+def wrap_word(value: int) -> int:
+	return ((value - WORD_MIN) & WORD_MASK) + WORD_MIN
+
+def is_word_buffer(words: Iterable[int]) -> bool:
+	return isinstance(words, memoryview) and words.format == "q" or isinstance(words, array) and words.typecode == "q"
+
+def as_page(words: Iterable[int]) -> array:
+	# packed int64 buffers are copied in one go, without going through Python ints
+	if isinstance(words, array) and words.typecode == "q": return words[:]
+
+	if is_word_buffer(words):
+		page = array("q")
+		page.frombytes(words.cast("B"))
+		return page
+
+	words = list(words)
+	try: return array("q", words)
+	except OverflowError: return array("q", (wrap_word(word) for word in words))
+
+class PagedRAM:
+	__slots__ = ("_pages", "_size", "_owned", "_shared")
+
+	def __init__(self, pages: list[list[int]|array], size: int, owned: set[int], shared: bool):
+		self._pages = pages
+		self._size = size
+		self._owned = owned
+		self._shared = shared
+
+	@staticmethod
+	def from_words(words: Iterable[int]) -> PagedRAM:
+		# packed int64 buffers become unowned array pages, which the first write to each copies into a list,
+		# so loading never boxes a Python int per word and written values are never narrowed to int64
+		if is_word_buffer(words):
+			with memoryview(words) as view:
+				pages = [ as_page(view[start:start + PAGE_SIZE]) for start in range(0, len(view), PAGE_SIZE) ]
+				return PagedRAM(pages, len(view), set(), False)
+
+		words = list(words)
+		pages = [ words[start:start + PAGE_SIZE] for start in range(0, len(words), PAGE_SIZE) ]
+		return PagedRAM(pages, len(words), set(range(len(pages))), False)
+
+	@property
+	def page_count(self) -> int:
+		return len(self._pages)
+
+	@property
+	def owned_page_count(self) -> int:
+		return len(self._owned)
+
+	def __len__(self) -> int:
+		return self._size
+
+	def __iter__(self) -> Iterator[int]:
+		return chain.from_iterable(self._pages)
+
+	def __getitem__(self, key: int|slice) -> int|list[int]:
+		if isinstance(key, slice): return self.tolist()[key]
+		if key < 0: key += self._size
+		if not 0 <= key < self._size: raise IndexError("RAM index out of range")
+		return self._pages[key >> PAGE_BITS][key & PAGE_MASK]
+
+	def __setitem__(self, key: int, value: int):
+		if key < 0: key += self._size
+		if not 0 <= key < self._size: raise IndexError("RAM assignment index out of range")
+		self._own(key >> PAGE_BITS)[key & PAGE_MASK] = value
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, PagedRAM): return self._size == other._size and self.tolist() == other.tolist()
+		if isinstance(other, list): return self.tolist() == other
+		return NotImplemented
+
+	def __repr__(self) -> str:
+		return repr(self.tolist())
+
+	def tolist(self) -> list[int]:
+		return list(chain.from_iterable(self._pages))
+
+	def clone(self) -> PagedRAM:
+		self._owned = set()
+		self._shared = True
+		return PagedRAM(self._pages, self._size, set(), True)
+
+	def _own_pages(self):
+		if self._shared:
+			self._pages = self._pages[:]
+			self._shared = False
+
+	def _own(self, page_key: int) -> list[int]:
+		self._own_pages()
+		page = self._pages[page_key]
+
+		if page_key not in self._owned:
+			page = self._pages[page_key] = list(page)
+			self._owned.add(page_key)
+
+		return page
+
+	def _grow(self, size: int):
+		if self._pages and len(self._pages[-1]) < PAGE_SIZE:
+			last = len(self._pages) - 1
+			self._own(last).extend([ 0 ]*(min(PAGE_SIZE, size - (last << PAGE_BITS)) - len(self._pages[last])))
+
+		self._own_pages()
+
+		while len(self._pages) << PAGE_BITS < size:
+			self._owned.add(len(self._pages))
+			self._pages.append([ 0 ]*min(PAGE_SIZE, size - (len(self._pages) << PAGE_BITS)))
+
+		self._size = size
+
+	def read(self, key: int) -> int:
+		return self._pages[key >> PAGE_BITS][key & PAGE_MASK] if 0 <= key < self._size else 0
+
+	def write(self, key: int, value: int):
+		if key >= self._size: self._grow(key + 1)
+		self._own(key >> PAGE_BITS)[key & PAGE_MASK] = value
+
+	def append(self, value: int):
+		self.write(self._size, value)
+
+	def read_range(self, start: int, count: int) -> list[int]:
+		words = [ 0 ]*max(count, 0)
+		key = max(start, 0)
+		end = min(start + count, self._size)
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			words[key - start:key - start + length] = self._pages[key >> PAGE_BITS][offset:offset + length]
+			key += length
+
+		return words
+
+	def iter_range(self, start: int, count: int) -> Iterator[tuple[int, list[int]]]:
+		key = max(start, 0)
+		end = min(start + count, self._size)
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			yield key, self._pages[key >> PAGE_BITS][offset:offset + length]
+			key += length
+
+	def fill_range(self, start: int, count: int, value: int):
+		key = max(start, 0)
+		end = min(start + count, self._size)
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			self._own(key >> PAGE_BITS)[offset:offset + length] = [ value ]*length
+			key += length
+
+	def write_range(self, start: int, words: Iterable[int]):
+		words = list(words)
+		if start < 0: words, start = words[-start:], 0
+		if not words: return
+		end = start + len(words)
+		if end > self._size: self._grow(end)
+		key = start
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			self._own(key >> PAGE_BITS)[offset:offset + length] = words[key - start:key - start + length]
+			key += length
+
+class SparseRAM:
+	__slots__ = ("_pages", "_size", "_owned", "_shared")
+
+	def __init__(self, pages: dict[int, array], size: int, owned: set[int], shared: bool):
+		self._pages = pages
+		self._size = size
+		self._owned = owned
+		self._shared = shared
+
+	@staticmethod
+	def from_words(words: Iterable[int]) -> SparseRAM:
+		ram = SparseRAM({ }, 0, set(), False)
+		ram.write_range(0, words)
+		return ram
+
+	@property
+	def page_count(self) -> int:
+		return len(self._pages)
+
+	@property
+	def owned_page_count(self) -> int:
+		return len(self._owned)
+
+	def __len__(self) -> int:
+		return self._size
+
+	def __iter__(self) -> Iterator[int]:
+		for start in range(0, self._size, PAGE_SIZE):
+			yield from self.read_range(start, min(PAGE_SIZE, self._size - start))
+
+	def __getitem__(self, key: int|slice) -> int|list[int]:
+		if isinstance(key, slice):
+			start, stop, step = key.indices(self._size)
+			if step == 1: return self.read_range(start, max(stop - start, 0))
+			return [ self.read(index) for index in range(start, stop, step) ]
+
+		if key < 0: key += self._size
+		if not 0 <= key < self._size: raise IndexError("RAM index out of range")
+		return self.read(key)
+
+	def __setitem__(self, key: int, value: int):
+		if key < 0: key += self._size
+		if not 0 <= key < self._size: raise IndexError("RAM assignment index out of range")
+		self.write(key, value)
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, (PagedRAM, SparseRAM, list)): return len(self) == len(other) and self.tolist() == list(other)
+		return NotImplemented
+
+	def __repr__(self) -> str:
+		return f"SparseRAM(size={self._size}, pages={len(self._pages)})"
+
+	def tolist(self) -> list[int]:
+		return self.read_range(0, self._size)
+
+	def code_words(self) -> array:
+		words = array("q")
+		previous: int = -1
+
+		for page_key in sorted(self._pages):
+			if page_key != previous + 1: words.append(0)
+			words.extend(self._pages[page_key][:self._size - (page_key << PAGE_BITS)])
+			previous = page_key
+
+		return words
+
+	def clone(self) -> SparseRAM:
+		self._owned = set()
+		self._shared = True
+		return SparseRAM(self._pages, self._size, set(), True)
+
+	def _own(self, page_key: int) -> array:
+		if self._shared:
+			self._pages = dict(self._pages)
+			self._shared = False
+
+		page = self._pages.get(page_key)
+
+		if page is None:
+			page = self._pages[page_key] = array("q", bytes(PAGE_SIZE*8))
+			self._owned.add(page_key)
+
+		elif page_key not in self._owned:
+			page = self._pages[page_key] = page[:]
+			self._owned.add(page_key)
+
+		return page
+
+	def read(self, key: int) -> int:
+		if not 0 <= key < self._size: return 0
+		page = self._pages.get(key >> PAGE_BITS)
+		return page[key & PAGE_MASK] if page is not None else 0
+
+	def write(self, key: int, value: int):
+		if key >= self._size: self._size = key + 1
+		if value == 0 and key >> PAGE_BITS not in self._pages: return
+		page = self._own(key >> PAGE_BITS)
+		try: page[key & PAGE_MASK] = value
+		except OverflowError: page[key & PAGE_MASK] = wrap_word(value)
+
+	def append(self, value: int):
+		self.write(self._size, value)
+
+	def read_range(self, start: int, count: int) -> list[int]:
+		words = [ 0 ]*max(count, 0)
+		key = max(start, 0)
+		end = min(start + count, self._size)
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			page = self._pages.get(key >> PAGE_BITS)
+			if page is not None: words[key - start:key - start + length] = page[offset:offset + length]
+			key += length
+
+		return words
+
+	def _stored_page_keys(self, key: int, end: int) -> Iterable[int]:
+		first, last = key >> PAGE_BITS, (end - 1) >> PAGE_BITS
+		if last - first < len(self._pages): return range(first, last + 1)
+		return sorted(page_key for page_key in self._pages if first <= page_key <= last)
+
+	# only stored pages are yielded, so every word between the chunks reads as zero
+	def iter_range(self, start: int, count: int) -> Iterator[tuple[int, array]]:
+		key = max(start, 0)
+		end = min(start + count, self._size)
+		if key >= end: return
+
+		for page_key in self._stored_page_keys(key, end):
+			page = self._pages.get(page_key)
+			if page is None: continue
+			page_start = page_key << PAGE_BITS
+			low, high = max(key, page_start), min(end, page_start + PAGE_SIZE)
+			yield low, page[low - page_start:high - page_start]
+
+	def fill_range(self, start: int, count: int, value: int):
+		key = max(start, 0)
+		end = min(start + count, self._size)
+		if key >= end: return
+		value = as_page([ value ])
+
+		if value[0] == 0:
+			for page_key in list(self._stored_page_keys(key, end)):
+				if page_key not in self._pages: continue
+				page_start = page_key << PAGE_BITS
+				low, high = max(key, page_start), min(end, page_start + PAGE_SIZE)
+				self._own(page_key)[low - page_start:high - page_start] = value*(high - low)
+
+			return
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			self._own(key >> PAGE_BITS)[offset:offset + length] = value*length
+			key += length
+
+	def write_range(self, start: int, words: Iterable[int]):
+		words = as_page(words)
+		if start < 0: words, start = words[-start:], 0
+		if not words: return
+		end = start + len(words)
+		self._size = max(self._size, end)
+		key = start
+
+		while key < end:
+			offset = key & PAGE_MASK
+			length = min(PAGE_SIZE - offset, end - key)
+			chunk = words[key - start:key - start + length]
+
+			if key >> PAGE_BITS in self._pages or any(chunk):
+				self._own(key >> PAGE_BITS)[offset:offset + length] = chunk
+
+			key += length
+
+type RAM = PagedRAM | SparseRAM
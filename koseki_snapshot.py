@@ -0,0 +1,396 @@
+from __future__ import annotations
+import struct
+import sys
+from array import array
+from collections import OrderedDict, deque
+from itertools import chain
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from typing import Iterable
+
+from koseki import Frame, Interpreter, Machine, Process, Program, Quota, QuotaPolicy, SignalPolicy, Usage, match_conditionals
+from koseki_ram import RAM, PagedRAM, SparseRAM, PAGE_SIZE, WORD_MIN, WORD_MAX
+from koseki_ops import *
+
+MAGIC: bytes = b"KOSEKI\x00\x00"
+VERSION: int = 7
+HEADER: struct.Struct = struct.Struct("<8sII")
+FLAG_BIG_ENDIAN: int = 1
+
+HAS_PARENT: int = 1
+HAS_SIGNAL_CAPACITY: int = 2
+HAS_DEADLINE: int = 1
+HAS_QUOTA: int = 16
+QUOTA_FIELDS: tuple[str, ...] = ("stack_depth", "RAM_words", "children", "instructions")
+
+RAM_WORDS: int = 0
+RAM_INTEGERS: int = 1
+RAM_PAGES: int = 2
+
+OP_WIDTH: int = 3
+PROCESS_WIDTH: int = 16
+FRAME_WIDTH: int = 7
+QUOTA_WIDTH: int = 1 + len(QUOTA_FIELDS)
+
+SNAPSHOT_OPS: tuple[type[OP], ...] = tuple(dict.fromkeys((*OPS, Sleep, Debug, *SUPERINSTRUCTIONS)))
+SNAPSHOT_OP_KINDS: dict[type[OP], int] = { op_type: kind for kind, op_type in enumerate(SNAPSHOT_OPS) }
+INTERPRETERS: tuple[Interpreter, ...] = tuple(Interpreter)
+SIGNAL_POLICIES: tuple[SignalPolicy, ...] = tuple(SignalPolicy)
+QUOTA_POLICIES: tuple[QuotaPolicy, ...] = tuple(QuotaPolicy)
+
+def _quota_row(quota: Quota|None) -> tuple[int, ...]:
+	if quota is None: return (0, )*QUOTA_WIDTH
+	values = [ getattr(quota, name) for name in QUOTA_FIELDS ]
+	flags = HAS_QUOTA | sum(1 << bit for bit, value in enumerate(values) if value is not None)
+	return (flags, *(value or 0 for value in values))
+
+def _parse_quota(row: tuple[int, ...]) -> Quota|None:
+	flags, *values = row
+	if not flags & HAS_QUOTA: return None
+	return Quota(*(value if flags & 1 << bit else None for bit, value in enumerate(values)))
+
+class SnapshotWriter:
+	def __init__(self):
+		self.words = array("q")
+
+	def write(self, value: int):
+		if WORD_MIN < value <= WORD_MAX:
+			self.words.append(value)
+			return
+
+		size = (value.bit_length() + 8 + 63)//64
+		self.words.append(WORD_MIN)
+		self.words.append(size)
+		self.words.frombytes(value.to_bytes(size*8, sys.byteorder, signed=True))
+
+	def write_keys(self, keys: Iterable[int]):
+		keys = list(keys)
+		self.words.append(len(keys))
+		for key in keys: self.write(key)
+
+	def write_bytes(self, data: bytes):
+		self.words.append(len(data))
+		self.words.frombytes(data + bytes(-len(data)%8))
+
+	def write_words(self, words: array):
+		self.words.append(len(words))
+		self.words.extend(words)
+
+	def write_table(self, values: list[int]):
+		try:
+			words = array("q", values)
+			if WORD_MIN in words: raise OverflowError
+
+		except OverflowError:
+			large = [ value for value in values if not WORD_MIN < value <= WORD_MAX ]
+			words = array("q", (value if WORD_MIN < value <= WORD_MAX else WORD_MIN for value in values))
+
+		else:
+			large = [ ]
+
+		self.write_keys(large)
+		self.write_words(words)
+
+class SnapshotReader:
+	def __init__(self, words: memoryview):
+		self.words = words
+		self.key = 0
+
+	def read(self) -> int:
+		value = self.words[self.key]
+		self.key += 1
+		if value != WORD_MIN: return value
+		size = self.words[self.key]
+		self.key += 1 + size
+		return int.from_bytes(self.words[self.key - size:self.key].cast("B"), sys.byteorder, signed=True)
+
+	def read_keys(self) -> list[int]:
+		return [ self.read() for _ in range(self.read()) ]
+
+	def read_bytes(self) -> bytes:
+		size = self.read()
+		start = self.key
+		self.key += (size + 7)//8
+		return self.words[start:self.key].cast("B")[:size].tobytes()
+
+	def read_words(self) -> memoryview:
+		size = self.read()
+		self.key += size
+		return self.words[self.key - size:self.key]
+
+	def read_table(self, width: int) -> Iterable[tuple[int, ...]]:
+		large = self.read_keys()
+		values = self.read_words().tolist()
+
+		if large:
+			replacements = iter(large)
+			values = [ next(replacements) if value == WORD_MIN else value for value in values ]
+
+		return zip(*[ iter(values) ]*width)
+
+def snapshot_machine(machine: Machine) -> bytes:
+	writer = SnapshotWriter()
+	programs: dict[int, int] = { }
+	program_ops: list[tuple[OP, ...]] = [ ]
+	stacks: dict[int, int] = { }
+	stack_words: list[array] = [ ]
+
+	def add_stack(stack: array|None) -> int:
+		if stack is None: return -1
+
+		if id(stack) not in stacks:
+			stacks[id(stack)] = len(stack_words)
+			stack_words.append(stack)
+
+		return stacks[id(stack)]
+
+	def add_program(ops: tuple[OP, ...]) -> int:
+		if id(ops) not in programs:
+			programs[id(ops)] = len(program_ops)
+			program_ops.append(ops)
+
+		return programs[id(ops)]
+
+	rows: list[int] = [ ]
+	frame_rows: list[int] = [ ]
+
+	for key, process in machine._processes.items():
+		add_program(process._ops)
+
+		for frame in process._frames or ():
+			frame_rows.extend((key, add_program(frame.ops), add_stack(frame.alt_data), frame.head, frame.a, frame.b, frame.c))
+
+		signals = process._signals[process._signal_head:] if process._signals is not None else None
+		flags = (HAS_PARENT if process._parent_process is not None else 0) | (HAS_SIGNAL_CAPACITY if process._signal_capacity is not None else 0)
+		rows.extend((
+			key, programs[id(process._ops)],
+			add_stack(process._data), add_stack(process._alt_data), add_stack(signals),
+			process._head, process._status, process._a, process._b, process._c,
+			process._sleep_ticks, machine._order[key],
+			process._parent_process or 0, process._signal_capacity or 0, flags, process._cost
+		))
+
+	ops: list[int] = [ ]
+	strings: list[bytes] = [ ]
+
+	for op in chain.from_iterable(program_ops):
+		match op:
+			case Debug(python=python):
+				extra = len(strings)
+				strings.append(python.encode())
+
+			case SetAConstantBArithmetics(function=function) | ConstantBArithmetics(function=function):
+				extra = function
+
+			case _:
+				extra = 0
+
+		ops.extend((SNAPSHOT_OP_KINDS[op.__class__], op.arg, extra))
+
+	writer.words.extend((
+		INTERPRETERS.index(machine._interpreter), machine._quantum, machine._program_cache_size,
+		machine._ready_sorted, SIGNAL_POLICIES.index(machine._signal_policy),
+		machine._signal_capacity is not None, machine._sparse_RAMs, machine._call_frames,
+		machine._optimize
+	))
+	writer.write(machine._tick)
+	writer.write(machine._next_order)
+	writer.write(machine._signal_capacity or 0)
+
+	writer.words.append(len(strings))
+	for string in strings: writer.write_bytes(string)
+	writer.write_table(ops)
+	writer.write_words(array("q", (len(ops) for ops in program_ops)))
+
+	writer.write_words(array("q", (len(stack) for stack in stack_words)))
+	for stack in stack_words: writer.words.extend(stack)
+	writer.write_table(rows)
+	writer.write_table(frame_rows)
+
+	writer.words.append(len(machine._RAMs))
+
+	for key, ram in machine._RAMs.items():
+		writer.write(key)
+
+		if isinstance(ram, SparseRAM):
+			page_keys = sorted(ram._pages)
+			writer.words.append(RAM_PAGES)
+			writer.write(len(ram))
+			writer.write_keys(page_keys)
+			for page_key in page_keys: writer.words.extend(ram._pages[page_key])
+			continue
+
+		try:
+			words = array("q", ram.tolist())
+			writer.words.append(RAM_WORDS)
+			writer.write_words(words)
+
+		except OverflowError:
+			writer.words.append(RAM_INTEGERS)
+			writer.write_keys(ram.tolist())
+
+	writer.write_keys(machine._ready)
+	writer.write_keys(machine._waiting)
+	writer.write_table(list(chain.from_iterable(
+		(key, deadline or 0, HAS_DEADLINE if deadline is not None else 0)
+		for key, deadline in machine._sleeping.items()
+	)))
+	writer.write_table(list(chain.from_iterable(machine._timers)))
+	writer.write_keys(machine._blocked_senders)
+
+	for index, senders in machine._blocked_senders.items():
+		writer.write_keys(key for key, sender in senders if machine._processes.get(key) is sender)
+
+	writer.words.extend((QUOTA_POLICIES.index(machine._quota_policy), machine._throttle_ticks))
+	writer.write(machine._instructions)
+	writer.write_table([ *_quota_row(machine._process_quota), *_quota_row(machine._machine_quota) ])
+	writer.write_table(list(chain.from_iterable((key, *_quota_row(quota)) for key, quota in machine._process_quotas.items())))
+	writer.write_table(list(chain.from_iterable(
+		(key, usage.instructions, usage.RAM_words, usage.children) for key, usage in machine._usage.items()
+	)))
+	writer.write_table(list(chain.from_iterable(machine._spawners.items())))
+	writer.write_table(list(chain.from_iterable(machine._generations.items())))
+
+	flags = FLAG_BIG_ENDIAN if sys.byteorder == "big" else 0
+	return HEADER.pack(MAGIC, VERSION, flags) + writer.words.tobytes()
+
+def restore_machine(buffer: bytes|bytearray|memoryview|mmap) -> Machine:
+	with memoryview(buffer) as view:
+		magic, version, flags = HEADER.unpack_from(view)
+		if magic != MAGIC: raise ValueError("not a koseki snapshot")
+		if version != VERSION: raise ValueError(f"unsupported snapshot version {version}")
+
+		if bool(flags & FLAG_BIG_ENDIAN) != (sys.byteorder == "big"):
+			raise ValueError("snapshot was written with a different byte order")
+
+		with view[HEADER.size:].cast("q") as words:
+			return _restore(SnapshotReader(words))
+
+def _restore(reader: SnapshotReader) -> Machine:
+	interpreter, quantum, program_cache_size, ready_sorted, signal_policy, has_signal_capacity, sparse_RAMs, call_frames, optimize = (
+		reader.read() for _ in range(9)
+	)
+	tick = reader.read()
+	next_order = reader.read()
+	signal_capacity: int|None = reader.read()
+	if not has_signal_capacity: signal_capacity = None
+
+	strings = [ reader.read_bytes().decode() for _ in range(reader.read()) ]
+	ops: list[OP] = [ ]
+
+	for kind, arg, extra in reader.read_table(OP_WIDTH):
+		op_type = SNAPSHOT_OPS[kind]
+		if op_type is Debug: ops.append(Debug(arg, strings[extra]))
+		elif op_type in (SetAConstantBArithmetics, ConstantBArithmetics): ops.append(op_type(arg, extra))
+		else: ops.append(op_type(arg))
+
+	programs: list[Program] = [ ]
+	start: int = 0
+
+	for size in reader.read_words().tolist():
+		program_ops = tuple(ops[start:start + size])
+		programs.append(Program(program_ops, match_conditionals(program_ops)))
+		start += size
+
+	stacks: list[array] = [ ]
+	sizes = reader.read_words().tolist()
+	words = reader.words[reader.key:reader.key + sum(sizes)].cast("B")
+	start = 0
+
+	for size in sizes:
+		stack = array("q")
+		stack.frombytes(words[start:start + size*8])
+		stacks.append(stack)
+		start += size*8
+
+	words.release()
+	reader.key += sum(sizes)
+	processes: dict[int, Process] = { }
+	order: dict[int, int] = { }
+
+	for (
+		key, program, data, alt_data, signals, head, status, a, b, c,
+		sleep_ticks, process_order, parent_process, process_signal_capacity, flags, cost
+	) in reader.read_table(PROCESS_WIDTH):
+		order[key] = process_order
+		processes[key] = Process(
+			stacks[data], stacks[alt_data] if alt_data >= 0 else None,
+			programs[program].ops, programs[program].jumps,
+			stacks[signals] if signals >= 0 else None, head,
+			a, b, c, status, parent_process if flags & HAS_PARENT else None, None,
+			sleep_ticks, process_signal_capacity if flags & HAS_SIGNAL_CAPACITY else None, _cost=cost
+		)
+
+	for key, program, alt_data, head, a, b, c in reader.read_table(FRAME_WIDTH):
+		process = processes[key]
+		if process._frames is None: process._frames = [ ]
+		alt = stacks[alt_data] if alt_data >= 0 else None
+		process._frames.append(Frame(programs[program].ops, programs[program].jumps, None, None, alt, head, a, b, c))
+		process._frame_words += len(alt) if alt is not None else 0
+
+	RAMs: dict[int, RAM] = { }
+	ram_type = SparseRAM if sparse_RAMs else PagedRAM
+
+	for _ in range(reader.read()):
+		key = reader.read()
+
+		kind = reader.read()
+
+		if kind == RAM_WORDS:
+			RAMs[key] = ram_type.from_words(reader.read_words().tolist())
+
+		elif kind == RAM_INTEGERS:
+			RAMs[key] = ram_type.from_words(reader.read_keys())
+
+		else:
+			size = reader.read()
+			pages: dict[int, array] = { }
+
+			for page_key in reader.read_keys():
+				pages[page_key] = array("q")
+				pages[page_key].frombytes(reader.words[reader.key:reader.key + PAGE_SIZE].cast("B"))
+				reader.key += PAGE_SIZE
+
+			RAMs[key] = SparseRAM(pages, size, set(pages), False)
+
+	ready = reader.read_keys()
+	waiting = reader.read_keys()
+	sleeping = { key: deadline if flags & HAS_DEADLINE else None for key, deadline, flags in reader.read_table(3) }
+	timers = list(reader.read_table(2))
+	blocked_senders: dict[int, deque[tuple[int, Process]]] = { }
+
+	for index in reader.read_keys():
+		blocked_senders[index] = deque((key, processes[key]) for key in reader.read_keys())
+
+	quota_policy = QUOTA_POLICIES[reader.read()]
+	throttle_ticks = reader.read()
+	instructions = reader.read()
+	process_quota, machine_quota = (_parse_quota(row) for row in reader.read_table(QUOTA_WIDTH))
+	process_quotas = { key: _parse_quota(row) for key, *row in reader.read_table(1 + QUOTA_WIDTH) }
+	usage = { key: Usage(*values) for key, *values in reader.read_table(4) }
+	spawners = dict(reader.read_table(2))
+	generations = dict(reader.read_table(2))
+
+	machine = Machine(
+		{ }, RAMs, INTERPRETERS[interpreter], quantum,
+		OrderedDict(), { }, program_cache_size,
+		_tick=tick, _ready=dict.fromkeys(ready), _ready_sorted=bool(ready_sorted),
+		_order=order, _next_order=next_order,
+		_waiting=set(waiting), _sleeping=sleeping, _timers=timers,
+		_signal_capacity=signal_capacity, _signal_policy=SIGNAL_POLICIES[signal_policy],
+		_blocked_senders=blocked_senders, _sparse_RAMs=bool(sparse_RAMs),
+		_process_quota=process_quota, _process_quotas=process_quotas, _machine_quota=machine_quota,
+		_quota_policy=quota_policy, _throttle_ticks=throttle_ticks,
+		_usage=usage, _spawners=spawners, _instructions=instructions, _generations=generations,
+		_call_frames=bool(call_frames), _optimize=bool(optimize)
+	)
+	machine._processes = processes
+	machine._recount()
+	return machine
+
+def save_snapshot(machine: Machine, path: str|Path):
+	Path(path).write_bytes(snapshot_machine(machine))
+
+def load_snapshot(path: str|Path) -> Machine:
+	with open(path, "rb") as file, mmap(file.fileno(), 0, access=ACCESS_READ) as mapped:
+		return restore_machine(mapped)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import struct
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+from types import CodeType
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from koseki_ops import *
+from koseki_ram import wrap_word
+
+if TYPE_CHECKING:
+	from koseki import Machine, Process
+
+type Step = Callable[[Machine, int], None]
+
+TRACE_OPS: tuple[type[OP], ...] = tuple(dict.fromkeys((*OPS, Sleep, Debug, *SUPERINSTRUCTIONS)))
+TRACE_OP_KINDS: dict[type[OP], int] = { op_type: kind for kind, op_type in enumerate(TRACE_OPS) }
+
+RECORD: struct.Struct = struct.Struct("<8q")
+TRACE_MAGIC: bytes = b"KOSEKITR"
+TRACE_VERSION: int = 1
+TRACE_HEADER: struct.Struct = struct.Struct("<8sII")
+
+@dataclass
+class TraceRecord:
+	tick: int
+	step: int
+	process: int
+	head: int
+	opcode: int
+	a: int
+	b: int
+	c: int
+
+	@property
+	def op_type(self) -> type[OP]|None:
+		return TRACE_OPS[self.opcode] if 0 <= self.opcode < len(TRACE_OPS) else None
+
+@cache
+def compile_debug(python: str) -> CodeType:
+	return compile(python, "<koseki debug>", "exec")
+
+def _RAM_keys(machine: Machine, process: Process, op: OP) -> tuple[int, ...]:
+	match op:
+		case ReadRAM() | WriteRAM() | DropRAM() | Call() | SpawnProcess() | Intrinsic():
+			return (machine._safe_get_RAM_key(process._a), )
+
+		case CloneRAM():
+			return (machine._safe_get_RAM_key(process._a), process._b)
+
+		case _:
+			return ()
+
+@dataclass
+class Tracer:
+	capacity: int = 4096
+	sample_rate: int = 1
+	processes: set[int]|None = None
+	ops: set[type[OP]]|None = None
+	RAM_keys: set[int]|None = None
+	steps: int = 0
+	count: int = 0
+	_buffer: bytearray = field(default_factory=bytearray, repr=False)
+	_countdown: int = field(default=0, repr=False)
+
+	def __post_init__(self):
+		self.capacity = max(self.capacity, 1)
+		if len(self._buffer) != self.capacity*RECORD.size: self._buffer = bytearray(self.capacity*RECORD.size)
+
+	@property
+	def dropped(self) -> int:
+		return max(self.count - self.capacity, 0)
+
+	def record(self, tick: int, process_key: int, process: Process, opcode: int):
+		offset = self.count % self.capacity*RECORD.size
+		values = (tick, self.steps, process_key, process._head, opcode, process._a, process._b, process._c)
+
+		try: RECORD.pack_into(self._buffer, offset, *values)
+		except struct.error: RECORD.pack_into(self._buffer, offset, *map(wrap_word, values))
+
+		self.count += 1
+
+	def run_step(self, process: Process, step: Step, machine: Machine, process_key: int):
+		self.steps += 1
+		head = process._head
+
+		if 0 <= head < len(process._ops) and (self.processes is None or process_key in self.processes):
+			op = process._ops[head]
+
+			if (
+				(self.ops is None or op.__class__ in self.ops)
+				and (self.RAM_keys is None or not self.RAM_keys.isdisjoint(_RAM_keys(machine, process, op)))
+			):
+				self._countdown -= 1
+
+				if self._countdown <= 0:
+					self._countdown = self.sample_rate
+					self.record(machine._tick, process_key, process, TRACE_OP_KINDS[op.__class__])
+
+		step(machine, process_key)
+
+	def raw_records(self, start: int = 0) -> bytes:
+		start = max(start, self.dropped)
+		if start >= self.count: return b""
+		first = start % self.capacity*RECORD.size
+		last = self.count % self.capacity*RECORD.size
+		if first < last: return bytes(self._buffer[first:last])
+		return bytes(self._buffer[first:]) + bytes(self._buffer[:last])
+
+	def records(self) -> list[TraceRecord]:
+		return [ TraceRecord(*values) for values in RECORD.iter_unpack(self.raw_records()) ]
+
+	def reset(self):
+		self.steps = 0
+		self.count = 0
+		self._countdown = 0
+
+@dataclass
+class TraceDumper:
+	path: Path
+	dumped: int = 0
+	lost: int = 0
+
+	def dump(self, tracer: Tracer) -> int:
+		if tracer.count < self.dumped: self.dumped = 0
+		start = max(self.dumped, tracer.dropped)
+		self.lost += start - self.dumped
+		records = tracer.raw_records(start)
+		self.dumped = tracer.count
+		path = Path(self.path)
+
+		with path.open("ab") as file:
+			if file.tell() == 0: file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+			file.write(records)
+
+		return len(records)//RECORD.size
+
+def iter_trace(path: Path) -> Iterator[TraceRecord]:
+	buffer = Path(path).read_bytes()
+	magic, version, size = TRACE_HEADER.unpack_from(buffer)
+	if magic != TRACE_MAGIC: raise ValueError("not a koseki trace")
+	if version != TRACE_VERSION or size != RECORD.size: raise ValueError(f"unsupported trace version {version}")
+	end = TRACE_HEADER.size + (len(buffer) - TRACE_HEADER.size)//RECORD.size*RECORD.size
+
+	for values in RECORD.iter_unpack(buffer[TRACE_HEADER.size:end]):
+		yield TraceRecord(*values)
+
+def read_trace(path: Path) -> list[TraceRecord]:
+	return list(iter_trace(path))
@@ -0,0 +1,190 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Container
+
+from koseki_intrinsics import INTRINSICS
+from koseki_ops import *
+
+WIDEN_AFTER: int = 4
+
+DATA_PUSHES: tuple[type[OP], ...] = (PushData, PushA, PushB, PushC)
+DATA_POPS: tuple[type[OP], ...] = (DropData, MoveA, MoveB, MoveC)
+DATA_READS: tuple[type[OP], ...] = (SetA, SetB, SetC, SetAConstantBArithmetics, DropDataPushA, DropDataPushData)
+CHECKED_OPS: tuple[type[OP], ...] = (*DATA_POPS, *DATA_READS, SaveAlt, LoadAlt)
+
+A_PRESERVING_OPS: tuple[type[OP], ...] = (
+	NoOP, PushData, DropData, ConditionalOpen, ConditionalClose, SaveAlt, LoadAlt, Halt,
+	SetB, SetC, PushA, PushB, PushC, ConstantB, ConstantC, MoveB, MoveC,
+	SendSignal, SpawnProcess, WriteRAM, CloneRAM, DropRAM, Sleep, Call,
+	DropDataPushA, DropDataPushData
+)
+
+RAM_KEY_OPS: tuple[type[OP], ...] = (ReadRAM, WriteRAM, CloneRAM, DropRAM, SpawnProcess, Call)
+
+@dataclass(slots=True)
+class OPState:
+	data_min: int
+	data_max: int|None
+	alt_min: int
+	alt_max: int|None
+	a: int|None
+
+ENTRY: OPState = OPState(0, 0, 0, 0, 0)
+UNKNOWN: OPState = OPState(0, None, 0, None, None)
+
+@dataclass
+class Verification:
+	states: tuple[OPState|None, ...]
+	proven: tuple[bool, ...]
+	max_depth: int|None
+	max_alt_depth: int|None
+	invalid_codes: tuple[int, ...]
+	unmatched: tuple[int, ...]
+	RAM_keys: dict[int, int]
+
+	@property
+	def dead(self) -> tuple[int, ...]:
+		return tuple(key for key, state in enumerate(self.states) if state is None)
+
+	@property
+	def checked(self) -> tuple[int, ...]:
+		return tuple(key for key, state in enumerate(self.states) if state is not None and not self.proven[key])
+
+	@property
+	def safe(self) -> bool:
+		return not self.checked and not self.invalid_codes and not self.unmatched
+
+	def missing_RAM_keys(self, RAM_keys: Container[int]) -> tuple[int, ...]:
+		return tuple(key for key, RAM_key in self.RAM_keys.items() if RAM_key not in RAM_keys)
+
+def _shift(bound: int|None, delta: int) -> int|None:
+	return None if bound is None else max(bound + delta, 0)
+
+def _transfer(op: OP, state: OPState) -> OPState:
+	data_min, data_max, alt_min, alt_max = state.data_min, state.data_max, state.alt_min, state.alt_max
+	a = state.a if isinstance(op, A_PRESERVING_OPS) else None
+
+	match op:
+		case ConstantA(arg=value):
+			a = value
+
+		case op if isinstance(op, DATA_PUSHES):
+			data_min, data_max = data_min + 1, _shift(data_max, 1)
+
+		case op if isinstance(op, DATA_POPS):
+			data_min, data_max = max(data_min - 1, 0), _shift(data_max, -1)
+
+		case DropDataPushA() | DropDataPushData():
+			data_min, data_max = max(data_min, 1), None if data_max is None else max(data_max, 1)
+
+		case SaveAlt():
+			alt_min, alt_max = alt_min + (data_min > 0), _shift(alt_max, data_max != 0)
+			data_min, data_max = max(data_min - 1, 0), _shift(data_max, -1)
+
+		case LoadAlt():
+			data_min, data_max = data_min + (alt_min > 0), _shift(data_max, alt_max != 0)
+			alt_min, alt_max = max(alt_min - 1, 0), _shift(alt_max, -1)
+
+		# a callee shares the data stack, so nothing is known about it afterwards
+		case Call():
+			data_min, data_max = 0, None
+
+		case Debug():
+			return UNKNOWN
+
+	return OPState(data_min, data_max, alt_min, alt_max, a)
+
+def _join(old: OPState, new: OPState, widen: bool) -> OPState:
+	data_min = min(old.data_min, new.data_min)
+	data_max = None if old.data_max is None or new.data_max is None else max(old.data_max, new.data_max)
+	alt_min = min(old.alt_min, new.alt_min)
+	alt_max = None if old.alt_max is None or new.alt_max is None else max(old.alt_max, new.alt_max)
+
+	# bounds still moving after a few visits belong to a loop, so jump straight to the limit
+	if widen:
+		if data_min < old.data_min: data_min = 0
+		if data_max != old.data_max: data_max = None
+		if alt_min < old.alt_min: alt_min = 0
+		if alt_max != old.alt_max: alt_max = None
+
+	return OPState(data_min, data_max, alt_min, alt_max, old.a if old.a == new.a else None)
+
+def _successors(ops: tuple[OP, ...], jumps: tuple[int, ...], key: int, a: int|None) -> tuple[int, ...]:
+	match ops[key]:
+		case Halt(): return ()
+		case ConditionalOpen() if a is not None: return (key + 1, ) if a != 0 else (jumps[key] + 1, )
+		case ConditionalClose() if a is not None: return (jumps[key] + 1, ) if a != 0 else (key + 1, )
+		case ConditionalOpen() | ConditionalClose(): return (key + 1, jumps[key] + 1)
+		case _: return (key + 1, )
+
+def _is_proven(op: OP, state: OPState) -> bool:
+	match op:
+		case LoadAlt(): return state.alt_min > 0
+		case op if isinstance(op, CHECKED_OPS): return state.data_min > 0
+		case _: return True
+
+def _is_matched(ops: tuple[OP, ...], jumps: tuple[int, ...], key: int) -> bool:
+	jump = jumps[key]
+	return 0 <= jump < len(ops) and jumps[jump] == key and isinstance(ops[jump], (ConditionalOpen, ConditionalClose))
+
+def _has_valid_code(op: OP) -> bool:
+	match op:
+		case Arithmetics(arg=code) | SetAConstantBArithmetics(function=code) | ConstantBArithmetics(function=code):
+			return 0 <= code < len(ARITHMETICS)
+
+		case Intrinsic(arg=code):
+			return 0 <= code < len(INTRINSICS)
+
+		case _:
+			return True
+
+def _uses_RAM_key(op: OP) -> bool:
+	match op:
+		case Intrinsic(arg=code): return 0 <= code < len(INTRINSICS) and INTRINSICS[code].name.startswith("RAM")
+		case op: return isinstance(op, RAM_KEY_OPS)
+
+def verify_OPs(ops: tuple[OP, ...], jumps: tuple[int, ...]) -> Verification:
+	states: list[OPState|None] = [ None ]*len(ops)
+	visits: list[int] = [ 0 ]*len(ops)
+	pending: list[int] = [ ]
+	max_depth: int|None = 0
+	max_alt_depth: int|None = 0
+
+	if ops:
+		states[0] = ENTRY
+		pending.append(0)
+
+	while pending:
+		key = pending.pop()
+		state = states[key]
+		after = _transfer(ops[key], state)
+		max_depth = None if max_depth is None or after.data_max is None else max(max_depth, after.data_max)
+		max_alt_depth = None if max_alt_depth is None or after.alt_max is None else max(max_alt_depth, after.alt_max)
+
+		for successor in _successors(ops, jumps, key, state.a):
+			if successor >= len(ops): continue
+			old = states[successor]
+			new = after if old is None else _join(old, after, visits[successor] >= WIDEN_AFTER)
+			if new == old: continue
+			states[successor] = new
+			visits[successor] += 1
+			pending.append(successor)
+
+	# a debug snippet can rewrite any part of the process, so it voids every proof in the program
+	has_debug = any(isinstance(op, Debug) for op in ops)
+
+	return Verification(
+		tuple(states),
+		tuple(not has_debug and state is not None and _is_proven(op, state) for op, state in zip(ops, states)),
+		max_depth,
+		max_alt_depth,
+		tuple(key for key, op in enumerate(ops) if not _has_valid_code(op)),
+		tuple(
+			key for key, op in enumerate(ops)
+			if isinstance(op, (ConditionalOpen, ConditionalClose)) and not _is_matched(ops, jumps, key)
+		),
+		{
+			key: state.a for key, (op, state) in enumerate(zip(ops, states))
+			if state is not None and state.a is not None and _uses_RAM_key(op)
+		}
+	)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from koseki import Interpreter, Machine, Process, parse_OPs
+from koseki_lockstep import run_lockstep
+from koseki_ops import *
+
+# code 13 fell back to Identity before Modular pow was appended, so programs using it now compute a power
+CASES: tuple[tuple[int, int, int, int], ...] = (
+	(3, 4, 5, 1), (2, 10, 1000, 24), (-2, 3, 7, 6), (7, 0, 5, 1), (7, 3, 0, 0), (7, -1, 5, 0), (5, 2, -7, -3)
+)
+
+def run_code(code: int, a: int, b: int, c: int, interpreter: Interpreter, optimize: bool) -> int:
+	machine = Machine.new(interpreter, 4, optimize=optimize)
+	machine.set_RAM(1, parse_OPs((ConstantA(a), ConstantB(b), ConstantC(c), Arithmetics(code), PushA(), ConstantB(0), SendSignal())))
+	machine.spawn_process(Process.load(machine.safe_get_program(1)), 1)
+	machine.run()
+	return machine.safe_get_process(0).drain_signals()[0]
+
+def test_modular_pow_code():
+	code = get_function("Modular pow")
+	assert code == 13 == len(ARITHMETICS) - 1
+
+	for a, b, c, expected in CASES:
+		for interpreter in Interpreter:
+			for optimize in (False, True):
+				assert run_code(code, a, b, c, interpreter, optimize) == expected, (a, b, c, interpreter, optimize)
+
+def test_codes_past_the_library_stay_identity():
+	for interpreter in Interpreter:
+		assert run_code(len(ARITHMETICS), 9, 2, 5, interpreter, False) == 9
+		assert run_code(-1, 9, 2, 5, interpreter, True) == 9
+
+def test_modular_pow_in_lockstep():
+	ops = (ConstantB(10), ConstantC(1000), SetA(), Arithmetics(get_function("Modular pow")), PushA(), Halt())
+	processes = [ Process.new(ops) for _ in range(32) ]
+	for value, process in enumerate(processes): process._data.append(value)
+	run_lockstep(processes, 100)
+	assert [ process._data[-1] for process in processes ] == [ pow(value, 10, 1000) for value in range(32) ]
+
+if __name__ == "__main__":
+	test_modular_pow_code()
+	test_codes_past_the_library_stay_identity()
+	test_modular_pow_in_lockstep()
+	print("ok")
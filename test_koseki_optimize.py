@@ -0,0 +1,80 @@
+from __future__ import annotations
+from random import Random
+
+from koseki import Interpreter, Machine, parse_OPs, safe_parse_RAM
+from koseki_ops import *
+from koseki_optimize import optimize_OPs
+
+SEEDS: int = 300
+STEPS: int = 5000
+# division and modulo raise on a zero divisor, so random programs leave them out
+FUNCTIONS: tuple[int, ...] = (0, 1, 2, 3, 6, 7, 8, 9, 10, 11, 12, 13)
+
+def random_body(random: Random) -> list[OP]:
+	ops: list[OP] = [ ]
+
+	for _ in range(random.randint(1, 14)):
+		ops += random.choice([
+			[ PushData(random.randint(-3, 9)) ], [ DropData() ], [ SaveAlt() ], [ LoadAlt() ], [ NoOP() ],
+			[ SetA() ], [ SetB() ], [ SetC() ], [ MoveA() ], [ MoveB() ], [ MoveC() ], [ PushA() ], [ PushB() ], [ PushC() ],
+			[ ConstantA(random.randint(0, 4)) ], [ ConstantB(random.randint(-2, 6)) ], [ ConstantC(random.randint(0, 3)) ],
+			[ Arithmetics(random.choice(FUNCTIONS)) ],
+			[ SetA(), ConstantB(random.randint(1, 3)), Arithmetics(random.choice(FUNCTIONS)) ],
+			[ DropData(), PushA() ], [ DropData(), PushData(random.randint(0, 5)) ],
+			[ ConstantA(random.randint(1, 3)), Call() ],
+			[ ConstantA(random.randint(0, 3)), ConstantB(random.randint(0, 6)), SetC(), WriteRAM() ],
+			[ ConstantA(random.randint(0, 3)), ConstantB(random.randint(0, 6)), ReadRAM() ],
+			[ ConstantB(0), SendSignal() ],
+			[
+				PushData(random.randint(0, 4)), SetA(), ConditionalOpen(), PushB(), MoveA(), ConstantB(1),
+				Arithmetics(get_function("Substraction")), PushA(), SetA(), ConditionalClose(), DropData()
+			],
+			[ Halt() ] if random.random() < .2 else [ NoOP() ]
+		])
+
+	return ops
+
+def random_program(random: Random) -> list[OP]:
+	# the registers and the top of the stack are sent to process 0, so the end state is observable
+	return random_body(random) + [
+		ConstantB(0), SendSignal(), PushB(), MoveA(), ConstantB(0), SendSignal(), PushC(), MoveA(), ConstantB(0),
+		SendSignal(), MoveA(), ConstantB(0), SendSignal(), LoadAlt(), MoveA(), ConstantB(0), SendSignal()
+	]
+
+def run_random(seed: int, optimize: bool) -> tuple|None:
+	random = Random(seed)
+	machine = Machine.new(
+		random.choice(list(Interpreter)), random.choice([ 1, 4, 64 ]), call_frames=seed % 2 == 0, optimize=optimize
+	)
+	RAMs = { key: parse_OPs(random_program(random) if key == 1 else random_body(random)) for key in range(1, 4) }
+	machine.init_with(RAMs, { 1 })
+	if not machine.run(STEPS): return None
+	return machine.safe_get_process(0).drain_signals(), { key: ram.tolist() for key, ram in machine._RAMs.items() }
+
+def test_optimizer_shrinks_random_programs():
+	random = Random(0)
+	programs = [ tuple(random_program(random)) for _ in range(SEEDS) ]
+	assert sum(map(len, map(optimize_OPs, programs))) < sum(map(len, programs))
+
+def test_optimized_runs_match_unoptimized():
+	finished: int = 0
+
+	for seed in range(SEEDS):
+		reference = run_random(seed, False)
+		if reference is None: continue
+		assert run_random(seed, True) == reference, seed
+		finished += 1
+
+	assert finished > SEEDS//2
+
+def test_optimize_applies_to_loaded_programs():
+	machine = Machine.new(optimize=True)
+	machine.set_RAM(1, parse_OPs((NoOP(), SetA(), ConstantB(1), Arithmetics(get_function("Addition")), Halt())))
+	ops = machine.safe_get_program(1).ops
+	assert ops != safe_parse_RAM(machine.safe_get_RAM(1)) and not any(isinstance(op, NoOP) for op in ops)
+
+if __name__ == "__main__":
+	test_optimizer_shrinks_random_programs()
+	test_optimized_runs_match_unoptimized()
+	test_optimize_applies_to_loaded_programs()
+	print("ok")
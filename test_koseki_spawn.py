@@ -0,0 +1,65 @@
+from __future__ import annotations
+from random import Random
+
+from koseki import Interpreter, Machine, Process, parse_OPs
+from koseki_ops import *
+
+SEEDS: int = 300
+TICKS: int = 200
+QUANTUMS: tuple[int, ...] = (1, 4, 64)
+
+def random_body(random: Random) -> list[OP]:
+	ops: list[OP] = [ ]
+
+	for _ in range(random.randint(1, 10)):
+		ops += random.choice([
+			[ PushData(random.randint(0, 3)) ], [ DropData() ], [ PushA() ], [ MoveB() ], [ NoOP() ],
+			[ ConstantA(random.randint(1, 4)), Call() ],
+			[ ConstantA(random.randint(1, 4)), ConstantB(random.randint(0, 6)), SpawnProcess() ],
+			[ ConstantA(random.randint(1, 3)), Sleep() ], [ Halt() ],
+			[ ConstantA(random.randint(0, 9)), ConstantB(random.randint(0, 6)), SendSignal() ],
+			[ PushData(3), ConditionalOpen(), MoveA(), ConstantB(1), Arithmetics(get_function("Substraction")), PushA(), PushA(), ConditionalClose() ]
+		])
+
+	return ops
+
+def respawn_machine(interpreter: Interpreter, quantum: int, callee: tuple[OP, ...]|None) -> Machine:
+	machine = Machine.new(interpreter, quantum, call_frames=True)
+	machine.set_RAM(1, parse_OPs((ConstantA(7), ConstantB(0), SendSignal(), Halt())))
+	call: tuple[OP, ...] = ()
+
+	if callee is not None:
+		machine.set_RAM(2, parse_OPs(callee))
+		call = (ConstantA(2), Call())
+
+	machine.spawn_process(Process.new((ConstantA(1), ConstantB(5), SpawnProcess(), *call, Halt())), 5)
+	return machine
+
+def assert_frames_counted(machine: Machine):
+	assert machine._frame_count == sum(process.call_depth for process in machine._processes.values())
+
+def test_self_respawn_runs_new_program():
+	for interpreter in Interpreter:
+		for quantum in QUANTUMS:
+			for callee in (None, (Halt(), ), (ConstantA(3), Sleep(), Halt())):
+				machine = respawn_machine(interpreter, quantum, callee)
+				machine.run(50)
+				assert machine.safe_get_process(0).drain_signals() == [ 7 ], (interpreter, quantum, callee)
+				assert 5 not in machine._processes and not machine._ready
+				assert_frames_counted(machine)
+
+def test_frame_count_matches_live_frames():
+	for seed in range(SEEDS):
+		random = Random(seed)
+		machine = Machine.new(random.choice(list(Interpreter)), random.choice(QUANTUMS), call_frames=True)
+		for key in range(1, 5): machine.set_RAM(key, parse_OPs(random_body(random)))
+		for key in range(1, 4): machine.spawn_process(Process.new(tuple(random_body(random))), key)
+
+		for _ in range(TICKS):
+			machine.run_step()
+			assert_frames_counted(machine)
+
+if __name__ == "__main__":
+	test_self_respawn_runs_new_program()
+	test_frame_count_matches_live_frames()
+	print("ok")
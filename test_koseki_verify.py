@@ -0,0 +1,80 @@
+from __future__ import annotations
+from random import Random
+
+import koseki
+from koseki import Interpreter, Machine, Process, parse_OPs
+from koseki_ops import *
+from koseki_verify import CHECKED_OPS, verify_OPs
+
+SEEDS: int = 400
+STEPS: int = 2000
+
+def random_body(random: Random) -> list[OP]:
+	ops: list[OP] = [ ]
+
+	for _ in range(random.randint(1, 12)):
+		ops += random.choice([
+			[ PushData(random.randint(-3, 9)) ], [ PushData(random.randint(0, 3)), PushData(1) ], [ DropData() ],
+			[ SaveAlt() ], [ LoadAlt() ], [ SetA() ], [ SetB() ], [ SetC() ], [ MoveA() ], [ MoveB() ], [ MoveC() ],
+			[ PushA() ], [ PushB() ], [ PushC() ], [ DropDataPushA() ], [ DropDataPushData(5) ],
+			[ SetAConstantBArithmetics(random.randint(0, 3), random.choice([ 0, 1, 2, 3, 7, 12, 15 ])) ],
+			[ ConstantA(random.randint(0, 1)) ], [ ConstantA(random.randint(1, 4)), Call() ],
+			[ ConstantC(random.randint(-2, 5)), Arithmetics(random.choice([ 1, 3, 7, 99 ])) ],
+			[ ConstantA(random.randint(0, 4)), ConstantB(random.randint(0, 6)), SetC(), WriteRAM() ],
+			[ ConstantA(0), ConditionalOpen(), PushData(1), ConditionalClose() ],
+			[ Halt() ], [ ConstantA(1), Sleep() ], [ NoOP() ],
+			[
+				PushData(4), ConditionalOpen(), MoveA(), ConstantB(1), Arithmetics(get_function("Substraction")),
+				PushA(), PushA(), ConditionalClose(), DropData()
+			],
+			[
+				PushData(3), SetA(), ConditionalOpen(), SaveAlt(), PushData(1), ConstantB(1), MoveA(),
+				Arithmetics(get_function("Substraction")), PushA(), PushA(), LoadAlt(), ConditionalClose()
+			]
+		])
+
+	return ops
+
+def run_random(seed: int, interpreter: Interpreter) -> tuple:
+	random = Random(seed)
+	machine = Machine.new(interpreter, random.choice([ 1, 4, 64 ]), call_frames=seed % 2 == 0)
+	for key in range(1, 5): machine.set_RAM(key, parse_OPs(random_body(random)))
+	process = Process.new(tuple(random_body(random) + random_body(random)))
+	if random.random() < .3: process._data.extend(random.randint(0, 3) for _ in range(3))
+	machine.spawn_process(process, 7)
+	finished = machine.run(STEPS)
+
+	return (
+		finished, machine.tick, process.status, process._a, process._b, process._c, process._data.tolist(),
+		list(process._alt_data or ()), { key: ram.tolist() for key, ram in machine._RAMs.items() }
+	)
+
+def run_checked(seed: int) -> tuple:
+	unchecked = dict(koseki.UNCHECKED_HANDLERS)
+	koseki.UNCHECKED_HANDLERS.clear()
+
+	try: return run_random(seed, Interpreter.THREADED)
+	finally: koseki.UNCHECKED_HANDLERS.update(unchecked)
+
+def test_random_programs_have_proven_ops():
+	proven: int = 0
+
+	for seed in range(SEEDS):
+		random = Random(seed)
+		ops = tuple(random_body(random))
+		verification = verify_OPs(ops, koseki.match_conditionals(ops))
+		proven += sum(isinstance(op, CHECKED_OPS) and is_proven for op, is_proven in zip(ops, verification.proven))
+
+	assert proven > SEEDS
+
+def test_unchecked_handlers_match_checked():
+	for seed in range(SEEDS):
+		reference = run_random(seed, Interpreter.MATCH)
+		assert run_checked(seed) == reference, seed
+		assert run_random(seed, Interpreter.THREADED) == reference, seed
+		assert run_random(seed, Interpreter.TIERED) == reference, seed
+
+if __name__ == "__main__":
+	test_random_programs_have_proven_ops()
+	test_unchecked_handlers_match_checked()
+	print("ok")